@@ -11,7 +11,9 @@ from .helpers.webhook import WebServer
 
 from .helpers.db import DBManager
 from .helpers.api import APIManager
+from .helpers.servers import GameServerInventory
 from .helpers.errors import on_app_command_error
+from .resources import Config
 
 
 class G5Bot(commands.AutoShardedBot):
@@ -25,12 +27,24 @@ class G5Bot(commands.AutoShardedBot):
         self.tree.on_error = on_app_command_error
         self.db: DBManager = DBManager(self)
         self.api: APIManager = APIManager(self)
+        self.servers: GameServerInventory = GameServerInventory(
+            self.api,
+            self.db,
+            Config.dathost_inventory_refresh_interval,
+            Config.dathost_server_lease_ttl,
+            Config.dathost_ready_poll_min,
+            Config.dathost_ready_poll_max,
+            Config.warm_pool_size,
+            Config.warm_pool_locations,
+            Config.warm_pool_idle_ttl
+        )
         self.webserver: WebServer = None
 
     @commands.Cog.listener()
     async def on_ready(self) -> None:
         await self.db.connect()
         self.api.connect(self.loop)
+        self.servers.start()
         self.webserver = WebServer(self)
         await self.webserver.start_webhook_server()
 
@@ -42,6 +56,8 @@ class G5Bot(commands.AutoShardedBot):
                     await self.check_guild_requirements(guild)
                 except: pass
 
+        self.dispatch('db_ready')
+
         self.logger.info("Syncing commands globally...")
         await self.tree.sync()
         self.logger.info("Commands have been successfully synced globally.")
@@ -59,11 +75,29 @@ class G5Bot(commands.AutoShardedBot):
     async def on_guild_remove(self, guild) -> None:
         """"""
         await self.db.sync_guilds([g.id for g in self.guilds])
+        self.db.invalidate_guild(guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel) -> None:
+        """"""
+        guild_model = self.db.guild_cache.peek(channel.guild.id)
+        if guild_model and channel.id in guild_model.referenced_ids:
+            self.db.invalidate_guild(channel.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role) -> None:
+        """"""
+        guild_model = self.db.guild_cache.peek(role.guild.id)
+        if guild_model and role.id in guild_model.referenced_ids:
+            self.db.invalidate_guild(role.guild.id)
 
     async def close(self):
         """"""
         await super().close()
+        if self.webserver:
+            await self.webserver.queue.close()
         await self.db.close()
+        await self.servers.close()
         await self.api.close()
 
     async def load_cogs(self) -> None:
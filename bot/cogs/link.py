@@ -23,10 +23,10 @@ class LinkCog(commands.Cog, name='Link'):
         player_model = await self.bot.db.get_player_by_discord_id(user.id)
 
         if player_model:
-            user_match = await self.bot.db.get_user_match(user.id, interaction.guild)
-            if user_match:
+            match_id = self.bot.get_cog('Match').get_user_match_id(user.id, interaction.guild_id)
+            if match_id:
                 raise CustomError(
-                    f"You can't change your steam while you belong to a live match #{user_match.id}")
+                    f"You can't change your steam while you belong to a live match #{match_id}")
             
             spectators = await self.bot.db.get_spectators(interaction.guild)
             for spec in spectators:
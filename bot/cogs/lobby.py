@@ -2,15 +2,18 @@
 
 from asyncpg.exceptions import UniqueViolationError
 from typing import List
-from collections import defaultdict
+from collections import Counter, defaultdict
 import asyncio
+import re
 
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import PermissionOverwrite, app_commands, Interaction, Embed, Member, VoiceState, HTTPException
 
 from bot.bot import G5Bot
 from bot.helpers.models import LobbyModel
 from bot.helpers.errors import CustomError, JoinLobbyError
+from bot.helpers.roster import LobbyRoster
+from bot.resources import Config
 from bot.views import ReadyView
 
 
@@ -61,6 +64,27 @@ class LobbyCog(commands.Cog, name="Lobby"):
         self.bot = bot
         self.locks = defaultdict(lambda: asyncio.Lock())
         self.in_progress = defaultdict(lambda: False)
+        self.lobby_channels = {}
+        self.voice_events = Counter()
+        self.roster = LobbyRoster(bot.db)
+
+    async def cog_unload(self):
+        """ Persist any pending queue changes before the cog goes away. """
+        self.flush_roster.cancel()
+        await self.roster.flush()
+
+    @commands.Cog.listener()
+    async def on_db_ready(self):
+        """ Load the voice channel to lobby index and lobby queues once the database is connected. """
+        self.lobby_channels = await self.bot.db.get_lobby_channels()
+        await self.roster.load(self.bot, self.lobby_channels)
+        if not self.flush_roster.is_running():
+            self.flush_roster.start()
+
+    @tasks.loop(seconds=Config.roster_flush_interval)
+    async def flush_roster(self):
+        """ Write queued lobby changes to the database in the background. """
+        await self.roster.flush()
 
     @app_commands.command(
         name='create-lobby',
@@ -122,6 +146,7 @@ class LobbyCog(commands.Cog, name="Lobby"):
         }
 
         lobby_id = await self.bot.db.insert_lobby(lobby_data)
+        self.lobby_channels[voice_channel.id] = lobby_id
 
         await voice_channel.edit(name=f"Lobby #{lobby_id}")
 
@@ -155,6 +180,10 @@ class LobbyCog(commands.Cog, name="Lobby"):
             self.bot.log_exception(f"Failed to remove lobby #{lobby_id}:", e)
             raise CustomError("Something went wrong! Please try again later.")
 
+        if lobby_model.voice_channel:
+            self.lobby_channels.pop(lobby_model.voice_channel.id, None)
+        self.roster.drop(lobby_id)
+
         try:
             await lobby_model.voice_channel.delete()
         except HTTPException:
@@ -188,7 +217,7 @@ class LobbyCog(commands.Cog, name="Lobby"):
                 except Exception as e:
                     pass
 
-            await self.bot.db.clear_lobby_users(lobby_model.id)
+            self.roster.clear(lobby_model.id)
             await self.update_queue_msg(lobby_model, title="Lobby has been emptied")
 
         embed = Embed(description=f"Lobby #{lobby_model.id} has been emptied.")
@@ -223,6 +252,34 @@ class LobbyCog(commands.Cog, name="Lobby"):
         embed = Embed(description=f"User {user.mention} has successfully removed from spectators list")
         await interaction.followup.send(embed=embed)
 
+    @app_commands.command(name="import-spectators", description="Add many users to the spectators list at once")
+    @app_commands.describe(users="Mentions or IDs of the users separated by spaces")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def import_spectators(self, interaction: Interaction, users: str):
+        """"""
+        await interaction.response.defer()
+        guild = interaction.guild
+        members = []
+        for user_id in dict.fromkeys(int(uid) for uid in re.findall(r'\d{15,20}', users)):
+            member = guild.get_member(user_id)
+            if member:
+                members.append(member)
+
+        if not members:
+            raise CustomError("No valid users were found.")
+
+        spectators = await self.bot.db.get_spectators(guild)
+        spectators_ids = [spec.steam_id for spec in spectators]
+        players = await self.bot.db.get_players(members)
+        new_specs = [p.discord for p in players if p.steam_id not in spectators_ids]
+
+        if new_specs:
+            await self.bot.db.insert_spectators(*new_specs, guild=guild)
+
+        skipped = len(members) - len(new_specs)
+        embed = Embed(description=f"Added {len(new_specs)} user(s) to the spectators list, skipped {skipped} unlinked or existing spectator(s).")
+        await interaction.followup.send(embed=embed)
+
     @app_commands.command(name="spectators-list", description="Show list of match spectators")
     async def spectators_list(self, interaction: Interaction):
         """"""
@@ -243,8 +300,16 @@ class LobbyCog(commands.Cog, name="Lobby"):
         if before.channel == after.channel:
             return
 
-        if before.channel is not None:
-            lobby_model = await self.bot.db.get_lobby_by_channel(before.channel)
+        before_lobby_id = self.lobby_channels.get(before.channel.id) if before.channel else None
+        after_lobby_id = self.lobby_channels.get(after.channel.id) if after.channel else None
+        if before_lobby_id is None and after_lobby_id is None:
+            self.voice_events['filtered'] += 1
+            return
+
+        self.voice_events['handled'] += 1
+
+        if before_lobby_id is not None:
+            lobby_model = await self.bot.db.get_lobby_by_id(before_lobby_id)
             if lobby_model:
                 if not self.in_progress[lobby_model.id]:
                     async with self.locks[lobby_model.id]:
@@ -254,8 +319,8 @@ class LobbyCog(commands.Cog, name="Lobby"):
                             self.bot.log_exception(
                                 "Uncaght exception when handling 'cogs.lobby._leave()' method:", e)
 
-        if after.channel is not None:
-            lobby_model = await self.bot.db.get_lobby_by_channel(after.channel)
+        if after_lobby_id is not None:
+            lobby_model = await self.bot.db.get_lobby_by_id(after_lobby_id)
             if lobby_model:
                 if not self.in_progress[lobby_model.id]:
                     async with self.locks[lobby_model.id]:
@@ -267,14 +332,14 @@ class LobbyCog(commands.Cog, name="Lobby"):
 
     async def _leave(self, user: Member, lobby_model: LobbyModel):
         """"""
-        removed = await self.bot.db.delete_lobby_users(lobby_model.id, [user])
+        removed = self.roster.remove(lobby_model.id, [user.id])
         if removed:
             title = f"User {user.display_name} removed from the lobby"
             await self.update_queue_msg(lobby_model, title)
 
     async def _join(self, user: Member, lobby_model: LobbyModel):
         """"""
-        lobby_users = await self.bot.db.get_lobby_users(lobby_model.id, lobby_model.guild)
+        lobby_users = self.get_lobby_users(lobby_model)
         try:
             await self.add_user_to_lobby(user, lobby_model, lobby_users)
         except JoinLobbyError as e:
@@ -283,6 +348,9 @@ class LobbyCog(commands.Cog, name="Lobby"):
             title = f"User **{user.display_name}** added to the queue."
             lobby_users.append(user)
 
+            if len(lobby_users) >= lobby_model.capacity * Config.warm_pool_fill_ratio:
+                self.bot.servers.schedule_prewarm(lobby_model.game_mode)
+
             if len(lobby_users) == lobby_model.capacity:
                 self.in_progress[lobby_model.id] = True
                 title = None
@@ -302,8 +370,8 @@ class LobbyCog(commands.Cog, name="Lobby"):
                 unreadied_users = set(lobby_users) - ready_view.ready_users
 
                 if unreadied_users:
+                    self.roster.remove(lobby_model.id, [u.id for u in unreadied_users])
                     awaitables = [u.move_to(guild_model.waiting_channel) for u in unreadied_users]
-                    awaitables.append(self.bot.db.delete_lobby_users(lobby_model.id, unreadied_users))
                     await asyncio.gather(*awaitables, return_exceptions=True)
                 else:
                     embed = Embed(description='Starting match setup...')
@@ -325,7 +393,7 @@ class LobbyCog(commands.Cog, name="Lobby"):
                         awaitables = [u.move_to(guild_model.waiting_channel) for u in lobby_users]
                         await asyncio.gather(*awaitables, return_exceptions=True)
 
-                    await self.bot.db.clear_lobby_users(lobby_model.id)
+                    self.roster.clear(lobby_model.id)
                 self.in_progress[lobby_model.id] = False
 
         await self.update_queue_msg(lobby_model, title)
@@ -333,33 +401,40 @@ class LobbyCog(commands.Cog, name="Lobby"):
     async def add_user_to_lobby(self, user: Member, lobby_model: LobbyModel, lobby_users: List[Member]):
         """"""
         player_model = await self.bot.db.get_player_by_discord_id(user.id)
-        match_data = await self.bot.db.get_user_match(user.id, lobby_model.guild)
+        match_id = self.bot.get_cog('Match').get_user_match_id(user.id, lobby_model.guild.id)
 
         if not player_model:
             raise JoinLobbyError(user, "User not linked")
-        if match_data:
+        if match_id:
             raise JoinLobbyError(user, "User in match")
         if user in lobby_users:
             raise JoinLobbyError(user, "User in lobby")
         if len(lobby_users) >= lobby_model.capacity:
             raise JoinLobbyError(user, "Lobby is full")
-        try:
-            await self.bot.db.insert_lobby_user(lobby_model.id, user)
-        except UniqueViolationError:
-            raise JoinLobbyError(user, "Please try again (Database Error)")
+        if not self.roster.add(lobby_model.id, user.id):
+            raise JoinLobbyError(user, "User in lobby")
+
+    def get_lobby_users(self, lobby_model: LobbyModel) -> List[Member]:
+        """ Resolve the queued members of a lobby from the in-memory roster. """
+        lobby_users = []
+        for user_id in self.roster.get(lobby_model.id):
+            user = lobby_model.guild.get_member(user_id)
+            if user:
+                lobby_users.append(user)
+        return lobby_users
 
     async def update_queue_msg(self, lobby_model: LobbyModel, title: str=None):
         """"""
         if not lobby_model.voice_channel:
             return
 
-        lobby_model = await self.bot.db.get_lobby_by_id(lobby_model.id)
-        lobby_users = await self.bot.db.get_lobby_users(lobby_model.id, lobby_model.guild)
+        lobby_users = self.get_lobby_users(lobby_model)
 
         try:
             queue_message = await lobby_model.voice_channel.fetch_message(lobby_model.message_id)
         except:
             queue_message = await lobby_model.voice_channel.send(embed=Embed(description="New Queue Message"))
+            lobby_model.message_id = queue_message.id
             await self.bot.db.update_lobby(lobby_model.id, {'last_message': queue_message.id})
 
         embed = self._embed_queue(
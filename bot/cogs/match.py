@@ -1,15 +1,18 @@
 # match.py
 
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import Embed, Member, Message, Guild, PermissionOverwrite, SelectOption, VoiceChannel, app_commands, Interaction
-from typing import List, Literal
+from typing import List, Literal, Optional
+from collections import defaultdict
 
 from random import choice, shuffle
 import asyncio
+import time
 
 from bot.helpers.api import Match
 from bot.helpers.utils import GAME_SERVER_LOCATIONS, generate_api_key, generate_scoreboard_img
 from bot.helpers.models import GuildModel, MatchModel
+from bot.helpers.cache import LRUCache
 from bot.bot import G5Bot
 from bot.helpers.errors import APIError, CustomError
 from bot.resources import Config
@@ -22,6 +25,51 @@ class MatchCog(commands.Cog, name="Match"):
 
     def __init__(self, bot: G5Bot):
         self.bot = bot
+        self.active_players = defaultdict(dict)
+        self.match_routes = LRUCache()
+        self.setup_timings = defaultdict(float)
+        self.setup_count = 0
+
+    @commands.Cog.listener()
+    async def on_db_ready(self):
+        """ Rebuild the active match membership index once the database is connected. """
+        active_players = await self.bot.db.get_active_match_players()
+        self.active_players = defaultdict(dict, active_players)
+        self.match_routes.clear()
+        for match_model in await self.bot.db.get_active_matches():
+            self.match_routes.set(match_model.api_key, match_model)
+        if Config.round_retention_days and not self.fold_rounds.is_running():
+            self.fold_rounds.start()
+
+    async def cog_unload(self):
+        """"""
+        self.fold_rounds.cancel()
+
+    @tasks.loop(hours=1)
+    async def fold_rounds(self):
+        """ Fold match timeline rounds past the retention window into per-match totals. """
+        try:
+            folded = await self.bot.db.fold_match_rounds(Config.round_retention_days)
+        except Exception as e:
+            self.bot.logger.error(e, exc_info=1)
+        else:
+            if folded:
+                self.bot.logger.info(f"Folded old match rounds into {folded} round totals")
+
+    async def get_match_by_api_key(self, api_key: str) -> Optional[MatchModel]:
+        """ Route a webhook API key to its live match, falling back to the database for keys not in memory. """
+        match_model = self.match_routes.get(api_key)
+        if match_model:
+            return match_model
+
+        match_model = await self.bot.db.get_match_by_api_key(api_key)
+        if match_model and not match_model.finished and not match_model.canceled:
+            self.match_routes.set(api_key, match_model)
+        return match_model
+
+    def get_user_match_id(self, user_id: int, guild_id: int) -> Optional[str]:
+        """ Return the ID of the unfinished match a user is playing in, if any. """
+        return self.active_players[guild_id].get(user_id)
 
     @app_commands.command(name="cancel-match", description="Cancel a live match")
     @app_commands.describe(match_id="Match ID")
@@ -35,17 +83,24 @@ class MatchCog(commands.Cog, name="Match"):
         if not match_model:
             raise CustomError("Invalid match ID.")
         
+        match_api = None
         try:
-            await self.bot.api.cancel_match(match_id)
-        except:
-            pass
+            match_api = await self.bot.api.cancel_match(match_id)
+        except APIError as e:
+            self.bot.logger.warning(f"Unable to cancel match #{match_id} on Dathost: {e}")
 
         try:
             await self.bot.api.stop_game_server(match_model.game_server_id)
-        except:
-            pass
+        except APIError as e:
+            self.bot.logger.warning(f"Unable to stop game server {match_model.game_server_id}: {e}")
+        self.bot.servers.schedule_refresh()
         
-        match_api = await self.bot.api.get_match(match_id)
+        if not match_api:
+            match_api = await self.bot.api.get_match(match_id)
+        if not (match_api.canceled or match_api.finished):
+            raise CustomError(f"Unable to cancel match #{match_id} on Dathost, it is still live.")
+        if self.bot.webserver:
+            await self.bot.webserver.rounds.flush(match_id)
         await self.finalize_match(match_model, match_api, guild_model)
 
         embed = Embed(description=f"Match #{match_id} cancelled successfully.")
@@ -84,6 +139,7 @@ class MatchCog(commands.Cog, name="Match"):
             'team': team
         }]
         await self.bot.db.insert_players_stats(players_stats)
+        self.active_players[interaction.guild.id][user.id] = match_id
 
         team_channel = None
         if team == "team1":
@@ -187,7 +243,16 @@ class MatchCog(commands.Cog, name="Match"):
         connect_time: int=300,
     ):
         """"""
-        await asyncio.sleep(3)
+        game_server = None
+        timings = {}
+        stage_start = time.monotonic()
+
+        def end_stage(stage):
+            nonlocal stage_start
+            now = time.monotonic()
+            timings[stage] = now - stage_start
+            stage_start = now
+
         try:
             if team_method == 'captains' and len(queue_users) >= 4:
                 team1_users, team2_users = await self.pick_teams(message, queue_users, captain_method)
@@ -196,12 +261,14 @@ class MatchCog(commands.Cog, name="Match"):
             else:
                 team1_users, team2_users = self.randomize_teams(queue_users)
             
-            team1_players_model = await self.bot.db.get_players(team1_users)
-            team2_players_model = await self.bot.db.get_players(team2_users)
+            players_model = await self.bot.db.get_players(team1_users + team2_users)
+            team1_players_model = [p for p in players_model if p.discord in team1_users]
+            team2_players_model = [p for p in players_model if p.discord in team2_users]
             team1_captain = team1_users[0]
             team2_captain = team2_users[0]
             team1_name = team1_captain.display_name
             team2_name = team2_captain.display_name
+            end_stage('teams')
 
             match_players = [ {
                 'steam_id_64': str(player.steam_id),
@@ -217,6 +284,7 @@ class MatchCog(commands.Cog, name="Match"):
                 map_name = veto_view.maps_left[0]
             else:
                 map_name = choice(mpool)
+            end_stage('map')
 
             placeholder = "Choose your game server location"
             options = [SelectOption(label=display_name, value=_id) for _id, display_name in GAME_SERVER_LOCATIONS.items()]
@@ -227,14 +295,13 @@ class MatchCog(commands.Cog, name="Match"):
             if any(x is None for x in dropdown.users_selections.values()):
                 raise asyncio.TimeoutError
             location = choice(list(dropdown.users_selections.values()))
+            end_stage('location')
 
             await message.edit(embed=Embed(description='Searching for available game servers...'), view=None)
-            await asyncio.sleep(2)
-
             game_server = await self.fetch_game_server(location, game_mode)
+            end_stage('server')
 
             await message.edit(embed=Embed(description='Setting up match on game server...'), view=None)
-            await asyncio.sleep(2)
 
             spectators = await self.bot.db.get_spectators(guild)
             for spec in spectators:
@@ -251,16 +318,14 @@ class MatchCog(commands.Cog, name="Match"):
                 connect_time,
                 api_key
             )
+            end_stage('create')
 
-            attempts = 0
-            game_server = await self.bot.api.get_game_server(game_server.id)
-            while not game_server.ip and attempts < 5:
-                game_server = await self.bot.api.get_game_server(game_server.id)
-                await asyncio.sleep(3)
-                attempts += 1
-            
-            if not game_server.ip:
-                raise(APIError("Something went wrong on game server."))
+            try:
+                game_server = await self.bot.servers.wait_ready(game_server.id, Config.dathost_ready_timeout)
+            except asyncio.TimeoutError:
+                raise APIError("Something went wrong on game server.")
+            end_stage('ready')
+            self.bot.servers.schedule_refresh()
 
             await message.edit(embed=Embed(description='Setting up teams channels...'), view=None)
             category, team1_channel, team2_channel = await self.create_match_channels(
@@ -269,22 +334,7 @@ class MatchCog(commands.Cog, name="Match"):
                 team2_users,
                 guild
             )
-
-            await self.bot.db.insert_match({
-                'id': api_match.id,
-                'game_server_id': game_server.id,
-                'guild': guild.id,
-                'channel': channel.id,
-                'message': message.id,
-                'category': category.id,
-                'team1_channel': team1_channel.id,
-                'team2_channel': team2_channel.id,
-                'team1_name': team1_name,
-                'team2_name': team2_name,
-                'map_name': map_name,
-                'api_key': api_key,
-                'connect_time': api_match.connect_time
-            })
+            end_stage('channels')
 
             players_stats = []
             for u in team1_players_model + team2_players_model:
@@ -292,7 +342,48 @@ class MatchCog(commands.Cog, name="Match"):
                                       'steam_id': u.steam_id,
                                       'user_id': u.discord.id,
                                       'team': 'team1' if u.discord in team1_users else 'team2'})
-            await self.bot.db.insert_players_stats(players_stats)
+
+            async with self.bot.db.transaction() as connection:
+                await self.bot.db.insert_match({
+                    'id': api_match.id,
+                    'game_server_id': game_server.id,
+                    'guild': guild.id,
+                    'channel': channel.id,
+                    'message': message.id,
+                    'category': category.id,
+                    'team1_channel': team1_channel.id,
+                    'team2_channel': team2_channel.id,
+                    'team1_name': team1_name,
+                    'team2_name': team2_name,
+                    'map_name': map_name,
+                    'api_key': api_key,
+                    'connect_time': api_match.connect_time
+                }, connection=connection)
+                await self.bot.db.insert_players_stats(players_stats, connection=connection)
+
+            for ps in players_stats:
+                self.active_players[guild.id][ps['user_id']] = api_match.id
+            self.match_routes.set(api_key, MatchModel(
+                api_match.id,
+                guild,
+                channel,
+                message.id,
+                category,
+                team1_channel,
+                team2_channel,
+                game_server.id,
+                team1_name,
+                team2_name,
+                map_name,
+                0,
+                0,
+                0,
+                api_match.connect_time,
+                False,
+                False,
+                api_key
+            ))
+            end_stage('db')
 
         except APIError as e:
             description = e.message
@@ -307,8 +398,21 @@ class MatchCog(commands.Cog, name="Match"):
             embed = self.embed_match_info(api_match, game_server)
             await message.edit(embed=embed)
 
+            self.setup_count += 1
+            for stage, elapsed in timings.items():
+                self.setup_timings[stage] += elapsed
+            self.bot.logger.info(
+                f"Match #{api_match.id} setup timings: " +
+                ', '.join(f"{stage}={elapsed:.2f}s" for stage, elapsed in timings.items())
+            )
             return True
 
+        if game_server:
+            try:
+                await self.bot.servers.release(game_server.id)
+            except Exception as e:
+                self.bot.logger.error(e, exc_info=1)
+
         embed = Embed(title="Match Setup Failed",
                       description=description, color=0xE02B2B)
         try:
@@ -318,19 +422,26 @@ class MatchCog(commands.Cog, name="Match"):
 
     async def fetch_game_server(self, location, game_mode):
         """"""
-        game_servers = await self.bot.api.get_game_servers()
-
-        for game_server in game_servers:
-            if game_server.booting:
-                continue
-            if not game_server.match_id:
+        game_server = await self.bot.servers.reserve(location, game_mode)
+        if not game_server:
+            await self.bot.servers.refresh()
+            game_server = await self.bot.servers.reserve(location, game_mode)
+        if not game_server:
+            raise ValueError("No game server available at the moment.")
+
+        if (game_server.location, game_server.game_mode) != (location, game_mode):
+            try:
                 await self.bot.api.update_game_server(
                     game_server.id,
                     game_mode=game_mode,
                     location=location)
-                return game_server
+            except Exception:
+                await self.bot.servers.release(game_server.id)
+                raise
+            game_server.location = location
+            game_server.game_mode = game_mode
 
-        raise ValueError("No game server available at the moment.")
+        return game_server
 
     async def create_match_channels(
         self,
@@ -370,7 +481,12 @@ class MatchCog(commands.Cog, name="Match"):
         return match_catg, team1_channel, team2_channel
 
     async def finalize_match(self, match_model: MatchModel, match_api: Match, guild_model: GuildModel):
-        """"""
+        """ Close a match once. Later calls for the same match, e.g. from retried webhooks, do nothing. """
+        if not await self.bot.db.close_match(match_api):
+            self.bot.logger.info(f"Match #{match_model.id} is already finalized or still live")
+            return
+        self.match_routes.pop(match_model.api_key)
+
         try:
             move_aws = [user.move_to(guild_model.waiting_channel)
                         for user in match_model.team1_channel.members + match_model.team2_channel.members]
@@ -396,25 +512,28 @@ class MatchCog(commands.Cog, name="Match"):
         except Exception as e:
             self.bot.logger.error(e, exc_info=1)
 
-        dict_stats = match_api.to_dict
-        dict_stats.pop('players')
-        
-        await self.bot.db.update_match(match_api.id, **dict_stats)
+        try:
+            await self.bot.servers.release(match_model.game_server_id)
+        except Exception as e:
+            self.bot.logger.error(e, exc_info=1)
+
+        guild_players = self.active_players[match_model.guild.id]
+        for user_id in [uid for uid, mid in guild_players.items() if mid == match_model.id]:
+            del guild_players[user_id]
 
         if not match_api.canceled:
-            team1_steam_ids = [ps.steam_id for ps in match_api.players if ps.team == 'team1']
-            team2_steam_ids = [ps.steam_id for ps in match_api.players if ps.team == 'team2']
-            team1_players_model = await self.bot.db.get_players_by_steam_ids(team1_steam_ids)
-            team2_players_model = await self.bot.db.get_players_by_steam_ids(team2_steam_ids)
-
-            team1_stats = {
-                player_model: next(player_stat for player_stat in match_api.players if player_model.steam_id == player_stat.steam_id)
-                for player_model in team1_players_model
-            }
-            team2_stats = {
-                player_model: next(player_stat for player_stat in match_api.players if player_model.steam_id == player_stat.steam_id)
-                for player_model in team2_players_model
-            }
+            # Fall back to the final payload when round webhooks were missed
+            match_players = await self.bot.db.get_match_round_totals(match_model.id, match_api.rounds_played) \
+                or match_api.players
+            team1_steam_ids = [ps.steam_id for ps in match_players if ps.team == 'team1']
+            team2_steam_ids = [ps.steam_id for ps in match_players if ps.team == 'team2']
+            players_model = await self.bot.db.get_players_by_steam_ids(team1_steam_ids + team2_steam_ids)
+            team1_players_model = [p for p in players_model if p.steam_id in team1_steam_ids]
+            team2_players_model = [p for p in players_model if p.steam_id in team2_steam_ids]
+
+            stats_by_steam_id = {player_stat.steam_id: player_stat for player_stat in match_players}
+            team1_stats = {player_model: stats_by_steam_id[player_model.steam_id] for player_model in team1_players_model}
+            team2_stats = {player_model: stats_by_steam_id[player_model.steam_id] for player_model in team2_players_model}
             file = generate_scoreboard_img(match_api, team1_stats, team2_stats)
             await guild_model.results_channel.send(file=file)
 
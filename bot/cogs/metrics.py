@@ -0,0 +1,116 @@
+# metrics.py
+
+from discord.ext import commands
+from discord import app_commands, Interaction, Embed
+
+from bot.bot import G5Bot
+
+
+class MetricsCog(commands.Cog, name='Metrics'):
+    def __init__(self, bot: G5Bot):
+        self.bot = bot
+
+    @app_commands.command(name="bot-metrics", description="View internal bot counters")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def view_metrics(self, interaction: Interaction):
+        await interaction.response.defer(ephemeral=True)
+        embed = Embed(title="Bot Metrics")
+
+        lobby_cog = self.bot.get_cog('Lobby')
+        if lobby_cog:
+            voice_events = lobby_cog.voice_events
+            embed.add_field(
+                name="**__Voice events__**",
+                value=f"Handled: `{voice_events['handled']}`\n"
+                      f"Filtered: `{voice_events['filtered']}`\n"
+                      f"Indexed lobbies: `{len(lobby_cog.lobby_channels)}`",
+                inline=False
+            )
+
+        guild_cache = self.bot.db.guild_cache
+        embed.add_field(
+            name="**__Guild config cache__**",
+            value=f"Hits: `{guild_cache.hits}`\n"
+                  f"Misses: `{guild_cache.misses}`\n"
+                  f"Hit rate: `{guild_cache.hit_rate}`\n"
+                  f"Cached guilds: `{len(guild_cache)}`",
+            inline=False
+        )
+
+        link_cache = self.bot.db.link_cache
+        embed.add_field(
+            name="**__Steam link cache__**",
+            value=f"Hits: `{link_cache.hits}`\n"
+                  f"Misses: `{link_cache.misses}`\n"
+                  f"Hit rate: `{link_cache.hit_rate}`\n"
+                  f"Cached links: `{len(link_cache)}`",
+            inline=False
+        )
+
+        webserver = self.bot.webserver
+        if webserver:
+            queue = webserver.queue
+            embed.add_field(
+                name="**__Webhook queue__**",
+                value=f"Depth: `{queue.depth}` / `{queue.max_depth}`\n"
+                      f"Duplicates dropped: `{webserver.duplicates}`\n"
+                      f"Matches queued: `{len(queue.pending)}`\n"
+                      f"Busy workers: `{queue.busy}` / `{queue.workers}`\n"
+                      f"Processed: `{queue.counts['processed']}` "
+                      f"(failed `{queue.counts['failed']}`, rejected `{queue.counts['rejected']}`)\n" +
+                      '\n'.join(
+                          f"{event}: avg `{hist.mean * 1000:.0f}ms` / p95 <`{hist.quantile(0.95) * 1000:.0f}ms`"
+                          for event, hist in queue.latency.items()
+                      ),
+                inline=False
+            )
+
+            rounds = webserver.rounds
+            embed.add_field(
+                name="**__Round updates__**",
+                value=f"Live matches: `{len(rounds.matches)}`\n"
+                      f"Rounds finalized: `{rounds.counts['rounds']}`\n"
+                      f"Scoreboard edits saved: `{rounds.counts['saved_edits']}`",
+                inline=False
+            )
+
+        match_cog = self.bot.get_cog('Match')
+        if match_cog:
+            routes = match_cog.match_routes
+            embed.add_field(
+                name="**__Webhook routing__**",
+                value=f"Live matches: `{len(routes)}`\n"
+                      f"Hits: `{routes.hits}`\n"
+                      f"Misses: `{routes.misses}`",
+                inline=False
+            )
+
+        if match_cog and match_cog.setup_count:
+            embed.add_field(
+                name="**__Match setup (avg)__**",
+                value='\n'.join(
+                    f"{stage}: `{total / match_cog.setup_count:.2f}s`"
+                    for stage, total in match_cog.setup_timings.items()
+                ) + f"\nSetups: `{match_cog.setup_count}`",
+                inline=False
+            )
+
+        api = self.bot.api
+        dathost_stats = '\n'.join(
+            f"`{endpoint}` {stats['requests']} req / {stats['failures']} err / "
+            f"{stats['retries']} retry / {stats['rejected']} rejected / {stats['coalesced']} shared / "
+            f"avg {api.latency[endpoint].mean * 1000:.0f}ms / p95 <{api.latency[endpoint].quantile(0.95) * 1000:.0f}ms / "
+            + ' '.join(f"{status}:{count}" for status, count in api.statuses[endpoint].items())
+            for endpoint, stats in sorted(api.stats.items())
+        )
+        embed.add_field(
+            name="**__Dathost API__**",
+            value=f"Circuit: `{api.breaker.state}`\n{dathost_stats}"[:1024],
+            inline=False
+        )
+
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
+
+async def setup(bot):
+    await bot.add_cog(MetricsCog(bot))
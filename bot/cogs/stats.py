@@ -57,6 +57,20 @@ class StatsCog(commands.Cog, name='Stats'):
         
         await interaction.edit_original_response(embed=embed, view=None)
 
+    @app_commands.command(name="rebuild-stats", description="Recompute all players stats from match history")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def rebuild_stats(self, interaction: Interaction):
+        await interaction.response.defer(ephemeral=True)
+
+        try:
+            drifted = await self.bot.db.rebuild_player_totals()
+        except Exception as e:
+            self.bot.logger.error(e, exc_info=1)
+            raise CustomError("Something went wrong! Please try again later.")
+
+        embed = Embed(description=f"Players stats have been rebuilt. {drifted} record(s) were out of sync.")
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
 
 async def setup(bot):
     await bot.add_cog(StatsCog(bot))
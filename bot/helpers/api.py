@@ -2,99 +2,155 @@
 
 import asyncio
 import logging
-import json
+import random
+import time
 import aiohttp
+from collections import Counter, defaultdict
+from operator import itemgetter
 from typing import Literal, Optional, List
 from bot.resources import Config
 from bot.helpers.errors import APIError
+from bot.helpers import codec
+from bot.helpers.metrics import Histogram
+
+
+STAT_FIELDS = ('kills', 'deaths', 'assists', 'headshots', 'mvps', 'k2', 'k3', 'k4', 'k5', 'score')
+STAT_KEYS = ('kills', 'deaths', 'assists', 'kills_with_headshot', 'mvps', '2ks', '3ks', '4ks', '5ks', 'score')
+
+
+def _stat(index: int) -> property:
+    """ Read one entry of a player's stat vector. """
+    return property(lambda self: self.stats[index])
+
+
+_get_stats = itemgetter(*STAT_KEYS)
 
 
 class MatchPlayer:
-    def __init__(self, data):
+    """ A player's line in a Dathost match, with the stat line kept as a vector ordered as STAT_FIELDS. """
+
+    __slots__ = ('match_id', 'steam_id', 'team', 'stats')
+
+    def __init__(self, data: dict):
         self.match_id = data['match_id']
         self.steam_id = int(data['steam_id_64'])
         self.team = data['team']
-        self.kills = data['stats']['kills']
-        self.assists = data['stats']['assists']
-        self.headshots = data['stats']['kills_with_headshot']
-        self.deaths = data['stats']['deaths']
-        self.mvps = data['stats']['mvps']
-        self.k2 = data['stats']['2ks']
-        self.k3 = data['stats']['3ks']
-        self.k4 = data['stats']['4ks']
-        self.k5 = data['stats']['5ks']
-        self.score = data['stats']['score']
+        self.stats = _get_stats(data['stats'])
 
     @classmethod
     def from_dict(cls, data: dict) -> "MatchPlayer":
         return cls(data)
-    
-    @property
-    def to_dict(self) -> dict:
-        return {
-            'kills': self.kills,
-            'deaths': self.deaths,
-            'assists': self.assists,
-            'headshots': self.headshots,
-            'mvps': self.mvps,
-            'k2': self.k2,
-            'k3': self.k3,
-            'k4': self.k4,
-            'k5': self.k5,
-            'score': self.score
-        }
+
+    @classmethod
+    def from_stats(cls, match_id: str, steam_id: int, team: str, stats: tuple) -> "MatchPlayer":
+        """ Build a stat line from a stat vector, e.g. one summed from the match timeline. """
+        player = cls.__new__(cls)
+        player.match_id = match_id
+        player.steam_id = steam_id
+        player.team = team
+        player.stats = stats
+        return player
+
+    kills = _stat(0)
+    deaths = _stat(1)
+    assists = _stat(2)
+    headshots = _stat(3)
+    mvps = _stat(4)
+    k2 = _stat(5)
+    k3 = _stat(6)
+    k4 = _stat(7)
+    k5 = _stat(8)
+    score = _stat(9)
 
 
 class Match:
-    """"""
+    """ A Dathost match, parsed from the raw payload on first access. """
+
+    __slots__ = ('_data', '_players')
 
     def __init__(self, match_data: dict) -> None:
         """"""
-        self.id = match_data['id']
-        self.game_server_id = match_data['game_server_id']
-        self.team1_name = match_data['team1']['name']
-        self.team2_name = match_data['team2']['name']
-        self.team1_score = match_data['team1']['stats']['score']
-        self.team2_score = match_data['team2']['stats']['score']
-        self.canceled = match_data['cancel_reason'] is not None
-        self.finished = match_data['finished']
-        self.connect_time = match_data['settings']['connect_time']
-        self.map_name = match_data['settings']['map']
-        self.rounds_played = match_data['rounds_played']
-        self.players = [MatchPlayer.from_dict(player) for player in match_data['players']]
+        self._data = match_data
+        self._players = None
 
     @classmethod
     def from_dict(cls, data: dict) -> "Match":
         return cls(data)
+
+    @classmethod
+    def from_payload(cls, data: dict) -> Optional["Match"]:
+        """ Build a match from a webhook payload, or return None if the payload is incomplete. """
+        match = cls(data)
+        try:
+            match.id, match.game_server_id, match.canceled, match.finished, match.rounds_played
+            match.team1_score, match.team2_score, match.map_name, match.connect_time
+            match.players
+        except (KeyError, TypeError, ValueError):
+            return None
+        return match
+
+    @property
+    def id(self) -> str:
+        return self._data['id']
+
+    @property
+    def game_server_id(self) -> str:
+        return self._data['game_server_id']
+
+    @property
+    def team1_name(self) -> str:
+        return self._data['team1']['name']
+
+    @property
+    def team2_name(self) -> str:
+        return self._data['team2']['name']
+
+    @property
+    def team1_score(self) -> int:
+        return self._data['team1']['stats']['score']
+
+    @property
+    def team2_score(self) -> int:
+        return self._data['team2']['stats']['score']
+
+    @property
+    def canceled(self) -> bool:
+        return self._data['cancel_reason'] is not None
+
+    @property
+    def finished(self) -> bool:
+        return self._data['finished']
+
+    @property
+    def connect_time(self) -> int:
+        return self._data['settings']['connect_time']
+
+    @property
+    def map_name(self) -> str:
+        return self._data['settings']['map']
+
+    @property
+    def rounds_played(self) -> int:
+        return self._data['rounds_played']
+
+    @property
+    def players(self) -> List[MatchPlayer]:
+        if self._players is None:
+            self._players = [MatchPlayer(player) for player in self._data['players']]
+        return self._players
     
     @property
     def winner(self):
         if self.canceled or not self.finished:
             return 'none'
         return 'team1' if self.team1_score > self.team2_score else 'team2'
-    
-    @property
-    def to_dict(self) -> dict:
-        return {
-            'id': self.id,
-            'game_server_id': self.game_server_id,
-            'team1_name': self.team1_name,
-            'team2_name': self.team2_name,
-            'team1_score': self.team1_score,
-            'team2_score': self.team2_score,
-            'canceled': self.canceled,
-            'finished': self.finished,
-            'map_name': self.map_name,
-            'connect_time': self.connect_time,
-            'rounds_played': self.rounds_played,
-            'players': self.players,
-            'winner': self.winner
-        }
 
 
 class GameServer:
     """"""
 
+    __slots__ = ('id', 'name', 'ip', 'port', 'gotv_port', 'on', 'game_mode', 'location', 'match_id', 'booting')
+
     def __init__(self, data: dict) -> None:
         """"""
         self.id = data['id']
@@ -104,6 +160,7 @@ class GameServer:
         self.gotv_port = data['ports']['gotv']
         self.on = data['on']
         self.game_mode = data['cs2_settings']['game_mode']
+        self.location = data.get('location')
         self.match_id = data['match_id']
         self.booting = data['booting']
 
@@ -112,30 +169,57 @@ class GameServer:
         return cls(data)
 
 
-async def start_request_log(session, ctx, params):
-    """"""
-    ctx.start = asyncio.get_event_loop().time()
-    logger = logging.getLogger('API')
-    logger.debug(f'Sending {params.method} request to {params.url}')
+class CircuitBreaker:
+    """ Fails fast after repeated failures, then lets a probe request through once the cooldown passes. """
 
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probe_at = None
 
-async def end_request_log(session, ctx, params):
-    """"""
-    logger = logging.getLogger('API')
-    elapsed = asyncio.get_event_loop().time() - ctx.start
-    logger.debug(f'Response received from {params.url} ({elapsed:.2f}s)\n'
-                f'    Status: {params.response.status}\n'
-                f'    Reason: {params.response.reason}')
-    try:
-        resp_json = await params.response.json()
-        logger.debug(f'Response JSON from {params.url}: {resp_json}')
-    except Exception as e:
-        pass
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self) -> bool:
+        """ Whether a request may be sent right now. While half-open only one probe is in flight at a time. """
+        state = self.state
+        if state != 'half-open':
+            return state == 'closed'
+
+        # A probe that never reported back, e.g. because it was cancelled, is replaced after another cooldown
+        now = time.monotonic()
+        if self.probe_at is not None and now - self.probe_at < self.reset_timeout:
+            return False
+        self.probe_at = now
+        return True
+
+    def record_success(self) -> None:
+        """"""
+        self.failures = 0
+        self.opened_at = None
+        self.probe_at = None
+
+    def record_failure(self) -> None:
+        """"""
+        self.failures += 1
+        self.probe_at = None
+        if self.failures >= self.failure_threshold or self.state == 'half-open':
+            self.opened_at = time.monotonic()
 
 
-TRACE_CONFIG = aiohttp.TraceConfig()
-TRACE_CONFIG.on_request_start.append(start_request_log)
-TRACE_CONFIG.on_request_end.append(end_request_log)
+class RetryableError(Exception):
+    """ Raised for Dathost responses that are worth retrying. """
+
+    def __init__(self, status: int):
+        self.status = status
+        super().__init__(f"Dathost responded with status {status}")
 
 
 class APIManager:
@@ -144,16 +228,30 @@ class APIManager:
     def __init__(self, bot):
         self.bot = bot
         self.logger = logging.getLogger("API")
+        self.breaker = CircuitBreaker(Config.dathost_breaker_threshold, Config.dathost_breaker_reset)
+        self.semaphore = None
+        self.stats = defaultdict(Counter)
+        self.statuses = defaultdict(Counter)
+        self.latency = defaultdict(Histogram)
+        self._inflight = {}
 
     def connect(self, loop):
         self.logger.info('Starting API helper client session')
+        # Created here rather than in __init__ so it binds to the running loop on Python 3.8/3.9
+        self.semaphore = asyncio.Semaphore(Config.dathost_max_concurrency)
+        connector = aiohttp.TCPConnector(
+            limit=Config.dathost_connector_limit,
+            limit_per_host=Config.dathost_connector_limit_per_host,
+            ttl_dns_cache=Config.dathost_connector_dns_ttl,
+            keepalive_timeout=Config.dathost_connector_keepalive,
+            loop=loop
+        )
         self.session = aiohttp.ClientSession(
-            base_url="https://dathost.net",
+            base_url=Config.dathost_base_url,
             auth=aiohttp.BasicAuth(Config.dathost_email, Config.dathost_password),
+            connector=connector,
             loop=loop,
-            json_serialize=lambda x: json.dumps(x, ensure_ascii=False),
-            timeout=aiohttp.ClientTimeout(total=30),
-            trace_configs=[TRACE_CONFIG] if Config.debug else None
+            json_serialize=codec.dumps
         )
 
     async def close(self):
@@ -161,25 +259,92 @@ class APIManager:
         self.logger.info('Closing API helper client session')
         await self.session.close()
 
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        endpoint: str,
+        idempotent: bool=True,
+        not_found: str=None,
+        **kwargs
+    ):
+        """
+        Send a request to Dathost and return the decoded JSON body.
+        Idempotent requests are retried with jittered exponential backoff on network errors and 5xx/429 responses.
+        """
+        stats = self.stats[endpoint]
+        if not self.breaker.allow():
+            stats['rejected'] += 1
+            raise APIError("Dathost is not responding at the moment, please try again later.")
+
+        timeout = aiohttp.ClientTimeout(total=Config.dathost_timeouts.get(endpoint, Config.dathost_timeout))
+        attempts = Config.dathost_max_retries + 1 if idempotent else 1
+
+        for attempt in range(1, attempts + 1):
+            stats['requests'] += 1
+            start = time.monotonic()
+            try:
+                async with self.semaphore:
+                    async with self.session.request(method, url, timeout=timeout, **kwargs) as resp:
+                        self.statuses[endpoint][resp.status] += 1
+                        self.logger.debug("%s %s -> %s (%.3fs)", method, url, resp.status, time.monotonic() - start)
+                        if resp.status == 401:
+                            raise APIError("Invalid Dathost credentials!")
+                        if resp.status == 404 and not_found:
+                            raise APIError(not_found)
+                        if resp.status == 429 or resp.status >= 500:
+                            raise RetryableError(resp.status)
+                        if not resp.ok:
+                            raise APIError(f"Dathost rejected the request ({resp.status} {resp.reason}).")
+                        body = await resp.read()
+            except APIError:
+                stats['failures'] += 1
+                self.latency[endpoint].observe(time.monotonic() - start)
+                # Dathost answered, so it is reachable even though it refused this request
+                self.breaker.record_success()
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError, RetryableError) as e:
+                stats['failures'] += 1
+                self.latency[endpoint].observe(time.monotonic() - start)
+                if not isinstance(e, RetryableError):
+                    self.statuses[endpoint][type(e).__name__] += 1
+                self.breaker.record_failure()
+                if attempt == attempts or not self.breaker.allow():
+                    self.logger.error(f"{method} {url} failed after {attempt} attempt(s): {e!r}")
+                    raise APIError("Something went wrong with Dathost, please try again later.") from e
+                stats['retries'] += 1
+                delay = min(Config.dathost_backoff_max, Config.dathost_backoff_base * 2 ** (attempt - 1))
+                await asyncio.sleep(random.uniform(0, delay))
+            else:
+                self.latency[endpoint].observe(time.monotonic() - start)
+                self.breaker.record_success()
+                if Config.dathost_trace_sample_rate and random.random() < Config.dathost_trace_sample_rate:
+                    self.logger.info(f"Sampled {method} {url} response: {body[:Config.dathost_trace_max_bytes]!r}")
+                return codec.loads(body) if body else None
+
+    async def _coalesced(self, method: str, url: str, endpoint: str, **kwargs):
+        """ Share one in-flight GET between concurrent callers asking for the same URL. """
+        key = (method, url)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._request(method, url, endpoint, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.stats[endpoint]['coalesced'] += 1
+        return await asyncio.shield(task)
+
     async def get_game_server(self, game_server_id: str) -> "GameServer":
         """"""
         url = f"/api/0.1/game-servers/{game_server_id}"
-
-        async with self.session.get(url=url) as resp:
-            if resp.status == 401:
-                raise APIError("Invalid Dathost credentials!")
-            resp_data = await resp.json()
-            return GameServer.from_dict(resp_data)
+        resp_data = await self._coalesced('GET', url, 'game-servers.get')
+        return GameServer.from_dict(resp_data)
         
     async def get_game_servers(self) -> List[GameServer]:
         """"""
         url = f"/api/0.1/game-servers"
-
-        async with self.session.get(url=url) as resp:
-            if resp.status == 401:
-                raise APIError("Invalid Dathost credentials!")
-            resp_data = await resp.json()
-            return [GameServer.from_dict(game_server) for game_server in resp_data if game_server['game'] == 'cs2']
+        resp_data = await self._request('GET', url, 'game-servers.list')
+        return [GameServer.from_dict(game_server) for game_server in resp_data if game_server['game'] == 'cs2']
         
     async def update_game_server(
         self,
@@ -193,29 +358,26 @@ class APIManager:
         if game_mode: payload["cs2_settings.game_mode"] = game_mode
         if location: payload["location"] = location
 
-        async with self.session.put(url=url, data=payload) as resp:
-            if resp.status == 401:
-                raise APIError("Invalid Dathost credentials!")
-            return resp.ok
+        await self._request('PUT', url, 'game-servers.update', data=payload)
+        return True
         
+    async def start_game_server(self, server_id: str):
+        """"""
+        url = f"/api/0.1/game-servers/{server_id}/start"
+        await self._request('POST', url, 'game-servers.start')
+        return True
+
     async def stop_game_server(self, server_id: str):
         """"""
         url = f"/api/0.1/game-servers/{server_id}/stop"
-
-        async with self.session.post(url=url) as resp:
-            if resp.status == 401:
-                raise APIError("Invalid Dathost credentials!")
-            return resp.ok
+        await self._request('POST', url, 'game-servers.stop')
+        return True
 
     async def get_match(self, match_id: str) -> Optional["Match"]:
         """"""
         url = f"/api/0.1/cs2-matches/{match_id}"
-
-        async with self.session.get(url=url) as resp:
-            if resp.status == 401:
-                raise APIError("Invalid Dathost credentials!")
-            resp_data = await resp.json()
-            return Match.from_dict(resp_data)
+        resp_data = await self._coalesced('GET', url, 'cs2-matches.get', not_found="Invalid match ID.")
+        return Match.from_dict(resp_data)
         
     async def create_match(
         self,
@@ -248,14 +410,8 @@ class APIManager:
             }
         }
 
-        async with self.session.post(url=url, json=payload) as resp:
-            if resp.ok:
-                resp_data = await resp.json()
-                return Match.from_dict(resp_data)
-            elif resp.status == 401:
-                raise APIError("Invalid Dathost credentials!")
-            else:
-                return APIError
+        resp_data = await self._request('POST', url, 'cs2-matches.create', idempotent=False, json=payload)
+        return Match.from_dict(resp_data)
 
     async def add_match_player(
         self,
@@ -270,28 +426,11 @@ class APIManager:
             'team': team,
         }
 
-        async with self.session.put(url=url, json=payload) as resp:
-            if resp.ok:
-                resp_data = await resp.json()
-                return MatchPlayer.from_dict(resp_data)
-            elif resp.status == 401:
-                raise APIError("Invalid Dathost credentials!")
-            elif resp.status == 404:
-                raise APIError("Invalid match ID.")
-            else:
-                return APIError
+        resp_data = await self._request('PUT', url, 'cs2-matches.players', not_found="Invalid match ID.", json=payload)
+        return MatchPlayer.from_dict(resp_data)
                 
     async def cancel_match(self, match_id: int):
         """"""
         url = f"/api/0.1/cs2-matches/{match_id}/cancel"
-
-        async with self.session.post(url=url) as resp:
-            if resp.ok:
-                resp_data = await resp.json()
-                return Match.from_dict(resp_data)
-            elif resp.status == 401:
-                raise APIError("Invalid Dathost credentials!")
-            elif resp.status == 404:
-                raise APIError("Invalid match ID.")
-            else:
-                return APIError
+        resp_data = await self._request('POST', url, 'cs2-matches.cancel', idempotent=False, not_found="Invalid match ID.")
+        return Match.from_dict(resp_data)
@@ -0,0 +1,102 @@
+# bot/helpers/cache.py
+
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class LRUCache:
+    """ A least recently used cache that keeps hit and miss counters. """
+
+    def __init__(self, maxsize: Optional[int]=None):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.data
+
+    def get(self, key: Hashable, default: Any=None) -> Any:
+        """ Return a cached value and count the lookup as a hit or a miss. """
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def peek(self, key: Hashable, default: Any=None) -> Any:
+        """ Return a cached value without touching its recency or the counters. """
+        return self.data.get(key, default)
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """ Cache a value, evicting the least recently used entry when full. """
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if self.maxsize is not None and len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any=None) -> Any:
+        """ Remove a cached value. """
+        return self.data.pop(key, default)
+
+    def clear(self) -> None:
+        """ Remove every cached value. """
+        self.data.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return round(self.hits / lookups, 2) if lookups else 0.00
+
+
+class LinkCache(LRUCache):
+    """ An LRU map of Discord user IDs to Steam IDs with a reverse index by Steam ID. """
+
+    def __init__(self, maxsize: Optional[int]=None):
+        super().__init__(maxsize)
+        self.user_ids = {}
+
+    def get_user_id(self, steam_id: int, default: Any=None) -> Any:
+        """ Return the Discord user ID linked to a Steam ID. """
+        user_id = self.user_ids.get(steam_id)
+        if user_id is None:
+            self.misses += 1
+            return default
+        self.data.move_to_end(user_id)
+        self.hits += 1
+        return user_id
+
+    def set(self, user_id: int, steam_id: int) -> None:
+        """ Cache a link, replacing any previous link of either ID. """
+        self.pop(user_id)
+        self.pop_steam(steam_id)
+        self.data[user_id] = steam_id
+        self.user_ids[steam_id] = user_id
+        while self.maxsize is not None and len(self.data) > self.maxsize:
+            _, evicted_steam_id = self.data.popitem(last=False)
+            self.user_ids.pop(evicted_steam_id, None)
+
+    def pop(self, user_id: int, default: Any=None) -> Any:
+        """ Remove the link of a Discord user ID. """
+        steam_id = self.data.pop(user_id, None)
+        if steam_id is None:
+            return default
+        self.user_ids.pop(steam_id, None)
+        return steam_id
+
+    def pop_steam(self, steam_id: int) -> None:
+        """ Remove the link of a Steam ID. """
+        user_id = self.user_ids.pop(steam_id, None)
+        if user_id is not None:
+            self.data.pop(user_id, None)
+
+    def clear(self) -> None:
+        """ Remove every cached link. """
+        super().clear()
+        self.user_ids.clear()
@@ -0,0 +1,22 @@
+# bot/helpers/codec.py
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj) -> str:
+    """ Serialize to a JSON string, keeping non-ASCII characters as is. """
+    if orjson:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, ensure_ascii=False)
+
+
+def loads(data):
+    """ Parse a JSON document from str or bytes. """
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -2,12 +2,15 @@
 
 import asyncpg
 import logging
-from typing import List, Union, Optional
+from contextlib import asynccontextmanager
+from typing import Dict, List, Union, Optional
 
 import discord
 
 from bot.resources import Config
 from bot.helpers.models import LobbyModel, MatchModel, GuildModel, PlayerModel, PlayerStatsModel
+from bot.helpers.api import Match, MatchPlayer, STAT_FIELDS
+from bot.helpers.cache import LinkCache, LRUCache
 
 
 class DBManager:
@@ -17,25 +20,52 @@ class DBManager:
         self.db_pool = None
         self.bot = bot
         self.logger = logging.getLogger('DB')
+        self.guild_cache = LRUCache()
+        self.link_cache = LinkCache(Config.link_cache_size)
 
     async def connect(self) -> None:
         """"""
         self.logger.info("Creating database connection pool.")
         db_connect_url = f'postgresql://{Config.POSTGRESQL_USER}:{Config.POSTGRESQL_PASSWORD}@{Config.POSTGRESQL_HOST}:{Config.POSTGRESQL_PORT}/{Config.POSTGRESQL_DB}'
-        self.db_pool = await asyncpg.create_pool(db_connect_url)
+        self.db_pool = await asyncpg.create_pool(
+            db_connect_url,
+            min_size=Config.POSTGRESQL_POOL_MIN_SIZE,
+            max_size=Config.POSTGRESQL_POOL_MAX_SIZE,
+            statement_cache_size=Config.POSTGRESQL_STATEMENT_CACHE_SIZE,
+            server_settings={
+                'statement_timeout': str(int(Config.POSTGRESQL_STATEMENT_TIMEOUT * 1000))
+            }
+        )
 
     async def close(self) -> None:
         """"""
         self.logger.info("Closing database connection pool.")
         await self.db_pool.close()
 
-    async def query(self, sql, *args) -> List[dict]:
-        """"""
+    async def query(self, sql, *args) -> List[asyncpg.Record]:
+        """ Run a write statement inside a transaction and return any rows it yields. """
+        async with self.db_pool.acquire() as connection:
+            async with connection.transaction():
+                return await connection.fetch(sql, *args)
+
+    @asynccontextmanager
+    async def transaction(self):
+        """ Acquire a connection and yield it inside a transaction. """
         async with self.db_pool.acquire() as connection:
             async with connection.transaction():
-                prepared_stmt = await connection.prepare(sql)
-                result = await prepared_stmt.fetch(*args)
-                return [dict(row.items()) for row in result]
+                yield connection
+
+    async def fetch(self, sql, *args) -> List[asyncpg.Record]:
+        """ Run a read query outside of a transaction using the statement cache. """
+        return await self.db_pool.fetch(sql, *args)
+
+    async def fetchrow(self, sql, *args) -> Optional[asyncpg.Record]:
+        """ Run a read query and return its first row only. """
+        return await self.db_pool.fetchrow(sql, *args)
+
+    async def fetchval(self, sql, *args, column: int=0):
+        """ Run a read query and return a single value from its first row. """
+        return await self.db_pool.fetchval(sql, *args, column=column)
 
     async def sync_guilds(self, guild_ids: List[int]) -> None:
         """"""
@@ -59,47 +89,63 @@ class DBManager:
         """"""
         sql = "SELECT * FROM matches\n" \
             f"    WHERE id = $1;"
-        data = await self.query(sql, match_id)
+        data = await self.fetchrow(sql, match_id)
         if data:
-            guild = self.bot.get_guild(data[0]['guild'])
+            guild = self.bot.get_guild(data['guild'])
             if guild:
-                return MatchModel.from_dict(data[0], guild)
+                return MatchModel.from_dict(data, guild)
 
     async def get_match_by_api_key(self, api_key: str) -> Optional["MatchModel"]:
         """"""
         sql = "SELECT * FROM matches\n" \
             f"    WHERE api_key = $1;"
-        data = await self.query(sql, api_key)
+        data = await self.fetchrow(sql, api_key)
         if data:
-            guild = self.bot.get_guild(data[0]['guild'])
+            guild = self.bot.get_guild(data['guild'])
             if guild:
-                return MatchModel.from_dict(data[0], guild)
+                return MatchModel.from_dict(data, guild)
 
     async def get_guild_matches(self, guild: discord.Guild) -> List["MatchModel"]:
         """"""
         sql = "SELECT * FROM matches WHERE guild = $1;"
-        matches_data = await self.query(sql, guild.id)
+        matches_data = await self.fetch(sql, guild.id)
         return [MatchModel.from_dict(data, guild) for data in matches_data]
 
-    async def get_user_match(self, user_id: int, guild: discord.Guild) -> Optional["MatchModel"]:
-        """"""
-        sql = "SELECT * FROM matches m\n" \
+    async def get_active_matches(self) -> List["MatchModel"]:
+        """ Return every unfinished match of the guilds this bot is in. """
+        sql = "SELECT * FROM matches\n" \
+            "    WHERE finished = false AND canceled = false;"
+        matches_data = await self.fetch(sql)
+        matches = []
+        for data in matches_data:
+            guild = self.bot.get_guild(data['guild'])
+            if guild:
+                matches.append(MatchModel.from_dict(data, guild))
+        return matches
+
+    async def get_active_match_players(self) -> Dict[int, Dict[int, str]]:
+        """ Map every guild to its users currently in an unfinished match. """
+        sql = "SELECT m.guild, m.id, ps.user_id FROM matches m\n" \
             "JOIN player_stats ps\n" \
-            "    ON ps.match_id = m.id AND ps.user_id = $1\n" \
-            "WHERE m.guild=$2 AND m.finished=false;"
-        data = await self.query(sql, user_id, guild.id)
-        if data:
-            return MatchModel.from_dict(data[0], guild)
+            "    ON ps.match_id = m.id\n" \
+            "WHERE m.finished = false AND m.canceled = false AND ps.user_id IS NOT NULL;"
+        data = await self.fetch(sql)
+        active_players = {}
+        for row in data:
+            active_players.setdefault(row['guild'], {})[row['user_id']] = row['id']
+        return active_players
 
-    async def insert_match(self, match_data: dict) -> None:
+    async def insert_match(self, match_data: dict, connection=None) -> None:
         """"""
         cols = ", ".join(col for col in match_data)
-        vals = ", ".join(f"'{val}'" if type(val) is
-                         str else str(val) for val in match_data.values())
+        placeholders = ", ".join(f"${idx}" for idx in range(1, len(match_data) + 1))
         sql = f"INSERT INTO matches ({cols})\n" \
-            f"    VALUES({vals});"
+            f"    VALUES({placeholders});"
 
-        await self.query(sql)
+        if connection:
+            await connection.execute(sql, *match_data.values())
+        else:
+            await self.query(sql, *match_data.values())
 
     async def update_match(self, match_id: str, **kwargs) -> None:
         """"""
@@ -114,42 +160,125 @@ class DBManager:
         """"""
         sql = f"DELETE FROM matches WHERE id = $1;"
         await self.query(sql, match_id)
+
+    async def close_match(self, match_api: Match) -> bool:
+        """
+        Store the final match state and fold its players' stats into player_totals.
+        Returns False if the match was closed before, or is still live and left to its match_end webhook.
+        The claim is rolled back with the rest when closing fails.
+        """
+        if not (match_api.finished or match_api.canceled):
+            return False
+
+        async with self.db_pool.acquire() as connection:
+            async with connection.transaction():
+                claimed = await connection.fetchval(
+                    "INSERT INTO match_events (match_id, event, rounds_played)\n"
+                    "    VALUES ($1, 'finalize', 0)\n"
+                    "ON CONFLICT DO NOTHING\n"
+                    "RETURNING match_id;",
+                    match_api.id
+                )
+                if not claimed:
+                    return False
+
+                await connection.execute(
+                    "UPDATE matches SET\n"
+                    "    team1_name = $2, team2_name = $3,\n"
+                    "    team1_score = $4, team2_score = $5,\n"
+                    "    canceled = $6, finished = $7,\n"
+                    "    map_name = $8, connect_time = $9,\n"
+                    "    rounds_played = $10, winner = $11\n"
+                    "WHERE id = $1;",
+                    match_api.id, match_api.team1_name, match_api.team2_name,
+                    match_api.team1_score, match_api.team2_score,
+                    match_api.canceled, match_api.finished,
+                    match_api.map_name, match_api.connect_time,
+                    match_api.rounds_played, match_api.winner
+                )
+                await connection.execute(
+                    "DELETE FROM match_events WHERE match_id = $1 AND event = 'round_end';",
+                    match_api.id
+                )
+
+                if match_api.canceled:
+                    await self.update_players_stats_from_rounds(match_api.id, connection=connection)
+                    return True
+
+                await self.update_players_stats(match_api.id, match_api.players, connection=connection)
+
+                # Aggregated exactly like rebuild_player_totals, so a rebuild finds no drift
+                await connection.execute(
+                    "INSERT INTO player_totals AS pt\n"
+                    "SELECT\n"
+                    "    ps.user_id, u.steam_id,\n"
+                    "    COALESCE(SUM(ps.kills), 0), COALESCE(SUM(ps.deaths), 0),\n"
+                    "    COALESCE(SUM(ps.assists), 0), COALESCE(SUM(ps.mvps), 0),\n"
+                    "    COALESCE(SUM(ps.headshots), 0), COALESCE(SUM(ps.k2), 0),\n"
+                    "    COALESCE(SUM(ps.k3), 0), COALESCE(SUM(ps.k4), 0),\n"
+                    "    COALESCE(SUM(ps.k5), 0), COALESCE(SUM(m.rounds_played), 0),\n"
+                    "    COUNT(*) FILTER (WHERE ps.team = m.winner),\n"
+                    "    COUNT(*)\n"
+                    "FROM player_stats ps\n"
+                    "JOIN matches m ON m.id = ps.match_id\n"
+                    "JOIN users u ON u.id = ps.user_id\n"
+                    "WHERE ps.match_id = $1\n"
+                    "GROUP BY ps.user_id, u.steam_id\n"
+                    "ON CONFLICT (user_id) DO UPDATE SET\n"
+                    "    steam_id = EXCLUDED.steam_id,\n"
+                    "    kills = pt.kills + EXCLUDED.kills,\n"
+                    "    deaths = pt.deaths + EXCLUDED.deaths,\n"
+                    "    assists = pt.assists + EXCLUDED.assists,\n"
+                    "    mvps = pt.mvps + EXCLUDED.mvps,\n"
+                    "    headshots = pt.headshots + EXCLUDED.headshots,\n"
+                    "    k2 = pt.k2 + EXCLUDED.k2,\n"
+                    "    k3 = pt.k3 + EXCLUDED.k3,\n"
+                    "    k4 = pt.k4 + EXCLUDED.k4,\n"
+                    "    k5 = pt.k5 + EXCLUDED.k5,\n"
+                    "    rounds_played = pt.rounds_played + EXCLUDED.rounds_played,\n"
+                    "    wins = pt.wins + EXCLUDED.wins,\n"
+                    "    total_matches = pt.total_matches + EXCLUDED.total_matches;",
+                    match_api.id
+                )
+                return True
     
+    async def acquire_server_lease(self, game_server_id: str, holder: str, ttl: float) -> bool:
+        """ Lease a game server to a holder unless another unexpired lease exists. """
+        sql = "INSERT INTO game_server_leases (game_server_id, holder, expires_at)\n" \
+            "    VALUES ($1, $2, now() + $3 * INTERVAL '1 second')\n" \
+            "ON CONFLICT (game_server_id) DO UPDATE\n" \
+            "    SET holder = EXCLUDED.holder, expires_at = EXCLUDED.expires_at\n" \
+            "    WHERE game_server_leases.expires_at < now()\n" \
+            "RETURNING game_server_id;"
+        leased = await self.query(sql, game_server_id, holder, float(ttl))
+        return bool(leased)
+
+    async def release_server_lease(self, game_server_id: str, holder: str=None) -> None:
+        """ Release a game server lease, only if it is still held by holder when one is given. """
+        sql = "DELETE FROM game_server_leases\n" \
+            "    WHERE game_server_id = $1 AND ($2::VARCHAR IS NULL OR holder = $2);"
+        await self.query(sql, game_server_id, holder)
+
+    async def claim_match_event(self, match_id: str, event: str, rounds_played: int=0) -> bool:
+        """ Record that a match event is being processed. Returns False if it was claimed before. """
+        sql = "INSERT INTO match_events (match_id, event, rounds_played)\n" \
+            "    VALUES ($1, $2, $3)\n" \
+            "ON CONFLICT DO NOTHING\n" \
+            "RETURNING match_id;"
+        claimed = await self.query(sql, match_id, event, rounds_played)
+        return bool(claimed)
+
+    async def release_match_event(self, match_id: str, event: str, rounds_played: int=0) -> None:
+        """ Forget a claimed match event so it can be processed again. """
+        sql = "DELETE FROM match_events\n" \
+            "    WHERE match_id = $1 AND event = $2 AND rounds_played = $3;"
+        await self.query(sql, match_id, event, rounds_played)
+
     async def get_players_stats(self, users_ids: List[int]) -> List[PlayerStatsModel]:
         """"""
-        sql = """
-        WITH MatchStats AS (
-            SELECT
-                ps2.user_id,
-                COUNT(*) FILTER (WHERE ps2.team = m.winner) AS wins,
-                SUM(m.rounds_played) AS rounds_played
-            FROM matches m
-            JOIN player_stats ps2 ON m.id = ps2.match_id
-            WHERE m.canceled = false
-            GROUP BY ps2.user_id
-        )
-        SELECT
-            ps.steam_id, ps.user_id,
-            SUM(ps.kills) as kills,
-            SUM(ps.deaths) as deaths,
-            SUM(ps.assists) as assists,
-            SUM(ps.headshots) as headshots,
-            SUM(ps.mvps) as mvps,
-            SUM(ps.k2) as k2,
-            SUM(ps.k3) as k3,
-            SUM(ps.k4) as k4,
-            SUM(ps.k5) as k5,
-            COUNT(ps.match_id) AS total_matches,
-            ms.wins,
-            ms.rounds_played
-        FROM player_stats ps
-        JOIN MatchStats ms ON ps.user_id = ms.user_id
-        WHERE ps.user_id = ANY($1::BIGINT[]) AND ps.match_id IN (
-            SELECT id FROM matches WHERE canceled = false
-        )
-        GROUP BY ps.steam_id, ps.user_id, ms.wins, ms.rounds_played;
-        """
-        query = await self.query(sql, users_ids)
+        sql = "SELECT * FROM player_totals\n" \
+            "    WHERE user_id = ANY($1::BIGINT[]);"
+        query = await self.fetch(sql, users_ids)
         players_stats = [PlayerStatsModel.from_dict(data) for data in query]
         index_map = {user_id: index for index, user_id in enumerate(users_ids)}
 
@@ -162,54 +291,111 @@ class DBManager:
         players_stats.sort(key=lambda player: index_map[player.user_id])
 
         return players_stats
-        
-    async def delete_player_stats(self, user_id: int):
-        sql = "DELETE FROM player_stats WHERE user_id = $1;"
-        await self.query(sql, user_id)
+
+    async def rebuild_player_totals(self) -> int:
+        """ Recompute player_totals from player_stats and return the number of drifted rows. """
+        async with self.db_pool.acquire() as connection:
+            async with connection.transaction():
+                await connection.execute(
+                    'CREATE TEMPORARY TABLE temp_player_totals (LIKE player_totals) ON COMMIT DROP;'
+                )
+                await connection.execute(
+                    "INSERT INTO temp_player_totals\n"
+                    "SELECT\n"
+                    "    ps.user_id, u.steam_id,\n"
+                    "    COALESCE(SUM(ps.kills), 0), COALESCE(SUM(ps.deaths), 0),\n"
+                    "    COALESCE(SUM(ps.assists), 0), COALESCE(SUM(ps.mvps), 0),\n"
+                    "    COALESCE(SUM(ps.headshots), 0), COALESCE(SUM(ps.k2), 0),\n"
+                    "    COALESCE(SUM(ps.k3), 0), COALESCE(SUM(ps.k4), 0),\n"
+                    "    COALESCE(SUM(ps.k5), 0), COALESCE(SUM(m.rounds_played), 0),\n"
+                    "    COUNT(*) FILTER (WHERE ps.team = m.winner),\n"
+                    "    COUNT(*)\n"
+                    "FROM player_stats ps\n"
+                    "JOIN matches m ON m.id = ps.match_id\n"
+                    "JOIN users u ON u.id = ps.user_id\n"
+                    "WHERE m.finished = true AND m.canceled = false\n"
+                    "GROUP BY ps.user_id, u.steam_id;"
+                )
+                drifted = await connection.fetchval(
+                    "SELECT COUNT(*) FROM temp_player_totals t\n"
+                    "FULL JOIN player_totals p ON p.user_id = t.user_id\n"
+                    "WHERE ROW(t.*) IS DISTINCT FROM ROW(p.*);"
+                )
+                await connection.execute('DELETE FROM player_totals;')
+                await connection.execute('INSERT INTO player_totals SELECT * FROM temp_player_totals;')
+                return drifted
 
     async def get_player_by_discord_id(self, user_id: int) -> Optional[PlayerModel]:
         """"""
+        steam_id = self.link_cache.get(user_id)
+        if steam_id is not None:
+            return PlayerModel(self.bot.get_user(user_id), steam_id)
+
         sql = "SELECT * FROM users\n" \
             f"    WHERE id = $1;"
-        data = await self.query(sql, user_id)
+        data = await self.fetchrow(sql, user_id)
         if data:
+            self.link_cache.set(data['id'], data['steam_id'])
             user = self.bot.get_user(user_id)
-            return PlayerModel.from_dict(data[0], user)
+            return PlayerModel.from_dict(data, user)
 
     async def get_player_by_steam_id(self, steam_id: int) -> Optional[PlayerModel]:
         """"""
+        user_id = self.link_cache.get_user_id(steam_id)
+        if user_id is not None:
+            return PlayerModel(self.bot.get_user(user_id), steam_id)
+
         sql = "SELECT * FROM users\n" \
             f"    WHERE steam_id = $1;"
-        data = await self.query(sql, steam_id)
+        data = await self.fetchrow(sql, steam_id)
         if data:
-            user = self.bot.get_user(data[0]['id'])
-            return PlayerModel.from_dict(data[0], user)
+            self.link_cache.set(data['id'], data['steam_id'])
+            user = self.bot.get_user(data['id'])
+            return PlayerModel.from_dict(data, user)
 
     async def get_players(self, users: List[discord.Member]) -> List[PlayerModel]:
-        """"""
-        users_ids = [u.id for u in users]
-        sql = "SELECT * FROM users\n" \
-            "    WHERE id = ANY($1::BIGINT[]) AND steam_id IS NOT NULL;"
-        users_data = await self.query(sql, users_ids)
-        db_user_ids = [u['id'] for u in users_data]
-        filtered_users = list(filter(lambda x: x.id in db_user_ids, users))
-        return_obj = []
-        for user in filtered_users:
-            for data in users_data:
-                if user.id == data['id']:
-                    return_obj.append(PlayerModel.from_dict(data, user))
-        return return_obj
+        """ Resolve linked players, fetching every cache miss in a single query. """
+        steam_ids = {}
+        missing_ids = []
+        for user in users:
+            steam_id = self.link_cache.get(user.id)
+            if steam_id is None:
+                missing_ids.append(user.id)
+            else:
+                steam_ids[user.id] = steam_id
+
+        if missing_ids:
+            sql = "SELECT * FROM users\n" \
+                "    WHERE id = ANY($1::BIGINT[]) AND steam_id IS NOT NULL;"
+            for data in await self.fetch(sql, missing_ids):
+                self.link_cache.set(data['id'], data['steam_id'])
+                steam_ids[data['id']] = data['steam_id']
+
+        return [PlayerModel(user, steam_ids[user.id]) for user in users if user.id in steam_ids]
     
     async def get_players_by_steam_ids(self, steam_ids: List[int]) -> List[PlayerModel]:
-        """"""
-        sql = "SELECT * FROM users\n" \
-            "    WHERE steam_id = ANY($1::BIGINT[]);"
-        users_data = await self.query(sql, steam_ids)
+        """ Resolve players by Steam ID, fetching every cache miss in a single query. """
+        user_ids = {}
+        missing_ids = []
+        for steam_id in steam_ids:
+            user_id = self.link_cache.get_user_id(steam_id)
+            if user_id is None:
+                missing_ids.append(steam_id)
+            else:
+                user_ids[steam_id] = user_id
+
+        if missing_ids:
+            sql = "SELECT * FROM users\n" \
+                "    WHERE steam_id = ANY($1::BIGINT[]);"
+            for data in await self.fetch(sql, missing_ids):
+                self.link_cache.set(data['id'], data['steam_id'])
+                user_ids[data['steam_id']] = data['id']
+
         players = []
-        for data in users_data:
-            user = self.bot.get_user(data['id'])
+        for steam_id in steam_ids:
+            user = self.bot.get_user(user_ids.get(steam_id))
             if user:
-                players.append(PlayerModel.from_dict(data, user))
+                players.append(PlayerModel(user, steam_id))
         return players
 
     async def insert_player(self, user_id: int, steam_id: int) -> None:
@@ -217,28 +403,39 @@ class DBManager:
         sql = f"INSERT INTO users (id, steam_id)\n" \
             f"    VALUES($1, $2);"
         await self.query(sql, user_id, steam_id)
+        self.link_cache.pop(user_id)
+        self.link_cache.pop_steam(steam_id)
 
     async def update_player(self, user_id: int, steam_id: int) -> None:
         """"""
         sql = 'UPDATE users SET steam_id = $1 WHERE id = $2;'
         await self.query(sql, steam_id, user_id)
+        self.link_cache.pop(user_id)
+        self.link_cache.pop_steam(steam_id)
 
     async def get_lobby_by_id(self, lobby_id: int) -> Union["LobbyModel", None]:
         """"""
         sql = "SELECT * FROM lobbies WHERE id = $1;"
-        data = await self.query(sql, lobby_id)
+        data = await self.fetchrow(sql, lobby_id)
         if data:
-            guild = self.bot.get_guild(data[0]['guild'])
+            guild = self.bot.get_guild(data['guild'])
             if guild:
-                return LobbyModel.from_dict(data[0], guild)
+                return LobbyModel.from_dict(data, guild)
 
     async def get_lobby_by_channel(self, channel: discord.VoiceChannel) -> Union["LobbyModel", None]:
         """"""
         sql = "SELECT * FROM lobbies\n" \
             f"    WHERE lobby_channel = $1;"
-        data = await self.query(sql, channel.id)
+        data = await self.fetchrow(sql, channel.id)
         if data:
-            return LobbyModel.from_dict(data[0], channel.guild)
+            return LobbyModel.from_dict(data, channel.guild)
+
+    async def get_lobby_channels(self) -> Dict[int, int]:
+        """ Map every lobby voice channel ID to its lobby ID. """
+        sql = "SELECT id, lobby_channel FROM lobbies\n" \
+            "    WHERE lobby_channel IS NOT NULL;"
+        data = await self.fetch(sql)
+        return {row['lobby_channel']: row['id'] for row in data}
 
     async def insert_lobby(self, data: dict) -> int:
         """"""
@@ -250,7 +447,7 @@ class DBManager:
             "RETURNING id;"
 
         lobby = await self.query(sql)
-        return list(map(lambda r: r['id'], lobby))[0]
+        return lobby[0]['id']
 
     async def update_lobby(self, lobby_id: int, data: dict) -> None:
         """"""
@@ -266,45 +463,64 @@ class DBManager:
         sql = f"DELETE FROM lobbies WHERE id = $1;"
         await self.query(sql, lobby_id)
 
-    async def get_lobby_users(self, lobby_id: int, guild) -> List[discord.Member]:
-        """"""
-        sql = "SELECT user_id FROM lobby_users\n" \
-            f"    WHERE lobby_id = $1;"
-        query = await self.query(sql, lobby_id)
-        users_ids = list(map(lambda r: r['user_id'], query))
-        lobby_users = []
-        for uid in users_ids:
-            user = guild.get_member(uid)
-            if user:
-                lobby_users.append(user)
-        return lobby_users
-
-    async def insert_lobby_user(self, lobby_id: int, user: discord.Member) -> None:
-        """"""
-        sql = "INSERT INTO lobby_users (lobby_id, user_id)\n" \
-            f"    VALUES($1, $2);"
-        await self.query(sql, lobby_id, user.id)
-
-    async def delete_lobby_users(self, lobby_id: int, users: List[discord.Member]) -> List[dict]:
-        """"""
-        sql = "DELETE FROM lobby_users\n" \
-            f"    WHERE lobby_id = $1 AND user_id::BIGINT = ANY(ARRAY{[u.id for u in users]}::BIGINT[])\n" \
-            "    RETURNING user_id;"
-        return await self.query(sql, lobby_id)
-
-    async def clear_lobby_users(self, lobby_id: int) -> None:
-        """"""
-        sql = f"DELETE FROM lobby_users WHERE lobby_id = $1;"
-        await self.query(sql, lobby_id)
+    async def get_lobbies_users(self) -> Dict[int, List[int]]:
+        """ Return the queued user IDs of every lobby. """
+        sql = "SELECT lobby_id, user_id FROM lobby_users;"
+        data = await self.fetch(sql)
+        lobbies_users = {}
+        for row in data:
+            lobbies_users.setdefault(row['lobby_id'], []).append(row['user_id'])
+        return lobbies_users
+
+    async def sync_lobby_users(
+        self,
+        cleared_lobbies: List[int],
+        removed: List[tuple],
+        added: List[tuple]
+    ) -> None:
+        """ Apply a batch of lobby queue changes in one transaction. """
+        async with self.transaction() as connection:
+            if cleared_lobbies:
+                await connection.execute(
+                    "DELETE FROM lobby_users WHERE lobby_id = ANY($1::INTEGER[]);",
+                    cleared_lobbies
+                )
+            if removed:
+                await connection.execute(
+                    "DELETE FROM lobby_users lu\n"
+                    "USING unnest($1::INTEGER[], $2::BIGINT[]) AS r(lobby_id, user_id)\n"
+                    "WHERE lu.lobby_id = r.lobby_id AND lu.user_id = r.user_id;",
+                    [r[0] for r in removed], [r[1] for r in removed]
+                )
+            if added:
+                await connection.execute(
+                    "INSERT INTO lobby_users (lobby_id, user_id)\n"
+                    "SELECT a.lobby_id, a.user_id\n"
+                    "FROM unnest($1::INTEGER[], $2::BIGINT[]) AS a(lobby_id, user_id)\n"
+                    "WHERE EXISTS (SELECT 1 FROM lobbies l WHERE l.id = a.lobby_id)\n"
+                    "    AND EXISTS (SELECT 1 FROM users u WHERE u.id = a.user_id)\n"
+                    "ON CONFLICT DO NOTHING;",
+                    [a[0] for a in added], [a[1] for a in added]
+                )
 
     async def get_guild_by_id(self, guild_id: int) -> Union["GuildModel", None]:
         """"""
+        guild_model = self.guild_cache.get(guild_id)
+        if guild_model:
+            return guild_model
+
         sql = "SELECT * FROM guilds\n" \
             f"    WHERE id =  $1;"
-        data = await self.query(sql, guild_id)
+        data = await self.fetchrow(sql, guild_id)
         if data:
             guild = self.bot.get_guild(guild_id)
-            return GuildModel.from_dict(data[0], guild)
+            guild_model = GuildModel.from_dict(data, guild)
+            self.guild_cache.set(guild_id, guild_model)
+            return guild_model
+
+    def invalidate_guild(self, guild_id: int) -> None:
+        """ Drop a cached guild configuration so the next lookup reloads it. """
+        self.guild_cache.pop(guild_id)
 
     async def update_guild_data(self, guild_id: int, data: dict) -> None:
         """"""
@@ -314,6 +530,7 @@ class DBManager:
             f'    SET {col_vals}\n' \
             f'    WHERE id = $1;'
         await self.query(sql, guild_id)
+        self.invalidate_guild(guild_id)
         
     async def get_spectators(self, guild: discord.Guild) -> List[PlayerModel]:
         """"""
@@ -321,15 +538,19 @@ class DBManager:
               "JOIN spectators s\n" \
               "    ON s.user_id = u.id\n" \
               "WHERE s.guild_id = $1;"
-        results = await self.query(sql, guild.id)
+        results = await self.fetch(sql, guild.id)
         return [PlayerModel.from_dict(row, guild.get_member(row["id"])) for row in results]
     
-    async def insert_spectators(self, *users: List[discord.Member], guild: discord.Guild):
-        """"""
-        values = f", ".join(
-            f"({guild.id}, {user.id})" for user in users)
-        sql = f"INSERT INTO spectators VALUES {values};"
-        await self.query(sql)
+    async def insert_spectators(self, *users: List[discord.Member], guild: discord.Guild, connection=None):
+        """"""
+        records = [(guild.id, user.id) for user in users]
+        if connection:
+            await connection.copy_records_to_table(
+                'spectators', records=records, columns=['guild_id', 'user_id'])
+        else:
+            async with self.transaction() as connection:
+                await connection.copy_records_to_table(
+                    'spectators', records=records, columns=['guild_id', 'user_id'])
         
     async def delete_spectators(self, *users: List[discord.Member], guild: discord.Guild):
         """"""
@@ -338,23 +559,130 @@ class DBManager:
               "RETURNING user_id;"
         return await self.query(sql, guild.id)
     
-    async def insert_players_stats(self, players_stats: List[dict]):
-        """"""
-        values =",\n".join(f"('{ps['match_id']}', {ps['steam_id']}, {ps['user_id']}, '{ps['team']}')"
-                           for ps in players_stats)
-        sql = f"INSERT INTO player_stats (match_id, steam_id, user_id, team) VALUES {values};"
-        await self.query(sql)
+    async def insert_players_stats(self, players_stats: List[dict], connection=None):
+        """"""
+        columns = ['match_id', 'steam_id', 'user_id', 'team']
+        records = [tuple(ps[col] for col in columns) for ps in players_stats]
+        if connection:
+            await connection.copy_records_to_table(
+                'player_stats', records=records, columns=columns)
+        else:
+            async with self.transaction() as connection:
+                await connection.copy_records_to_table(
+                    'player_stats', records=records, columns=columns)
     
-    async def update_player_stats(self, user_id: int, match_id: str, stats: dict):
-        """"""
-        col_vals = ",\n    ".join(
-            f"{key} = {val}" for key, val in stats.items()
-        )
-
-        sql = f'UPDATE player_stats SET {col_vals} WHERE user_id = $1 AND match_id = $2;'
-        await self.query(sql, user_id, match_id)
+    async def update_players_stats(self, match_id: str, players: List[MatchPlayer], connection=None):
+        """ Apply every player's stat line for a match in a single statement, keyed by steam ID. """
+        sql = "UPDATE player_stats ps SET\n" \
+            "    kills = s.kills, deaths = s.deaths, assists = s.assists,\n" \
+            "    headshots = s.headshots, mvps = s.mvps, k2 = s.k2, k3 = s.k3,\n" \
+            "    k4 = s.k4, k5 = s.k5, score = s.score\n" \
+            "FROM unnest(\n" \
+            "    $2::BIGINT[], $3::SMALLINT[], $4::SMALLINT[], $5::SMALLINT[], $6::SMALLINT[],\n" \
+            "    $7::SMALLINT[], $8::SMALLINT[], $9::SMALLINT[], $10::SMALLINT[], $11::SMALLINT[],\n" \
+            "    $12::SMALLINT[]\n" \
+            f") AS s(steam_id, {', '.join(STAT_FIELDS)})\n" \
+            "WHERE ps.match_id = $1 AND ps.steam_id = s.steam_id;"
+        if not players:
+            return
+        # Transpose the players' stat vectors into one array per column, ordered as STAT_FIELDS
+        args = [[p.steam_id for p in players]] + [list(column) for column in zip(*(p.stats for p in players))]
+        if connection:
+            await connection.execute(sql, match_id, *args)
+        else:
+            await self.query(sql, match_id, *args)
+
+    async def insert_match_round(self, match_api: Match) -> None:
+        """
+        Append a round to the match timeline in one statement.
+        Each player's delta is computed against the sum of the rounds already stored, so retried or skipped rounds stay consistent.
+        """
+        players = [p for p in match_api.players if p.team in ('team1', 'team2')]
+        if not players:
+            return
+        stat_cols = ', '.join(STAT_FIELDS)
+        sql = f"INSERT INTO match_rounds (match_id, round, steam_id, team, team1_score, team2_score, {stat_cols})\n" \
+            "SELECT $1, $2, s.steam_id, s.team::team, $3, $4,\n" \
+            "    " + ', '.join(f"s.{col} - COALESCE(p.{col}, 0)" for col in STAT_FIELDS) + "\n" \
+            "FROM unnest(\n" \
+            "    $5::BIGINT[], $6::VARCHAR[], $7::SMALLINT[], $8::SMALLINT[], $9::SMALLINT[], $10::SMALLINT[],\n" \
+            "    $11::SMALLINT[], $12::SMALLINT[], $13::SMALLINT[], $14::SMALLINT[], $15::SMALLINT[], $16::SMALLINT[]\n" \
+            f") AS s(steam_id, team, {stat_cols})\n" \
+            "LEFT JOIN (\n" \
+            "    SELECT steam_id, " + ', '.join(f"SUM({col}) AS {col}" for col in STAT_FIELDS) + "\n" \
+            "    FROM match_rounds WHERE match_id = $1 GROUP BY steam_id\n" \
+            ") p ON p.steam_id = s.steam_id\n" \
+            "ON CONFLICT (match_id, round, steam_id) DO NOTHING;"
+        args = [[p.steam_id for p in players], [p.team for p in players]] + \
+            [list(column) for column in zip(*(p.stats for p in players))]
+        await self.query(
+            sql, match_api.id, match_api.rounds_played, match_api.team1_score, match_api.team2_score, *args)
+
+    async def get_match_timeline(self, match_id: str) -> List[asyncpg.Record]:
+        """ Return a match's rounds in order, one row per player with that round's stat deltas. """
+        sql = f"SELECT round, steam_id, team, team1_score, team2_score, {', '.join(STAT_FIELDS)}\n" \
+            "FROM match_rounds WHERE match_id = $1\n" \
+            "ORDER BY round, steam_id;"
+        return await self.fetch(sql, match_id)
+
+    async def get_match_round_totals(self, match_id: str, rounds_played: int=0) -> List[MatchPlayer]:
+        """ Sum a match's timeline into one stat line per player, or return nothing if it stops before rounds_played. """
+        sql = "SELECT steam_id, (array_agg(team ORDER BY round DESC))[1] AS team,\n" \
+            "    MAX(MAX(round)) OVER () AS last_round,\n" \
+            "    " + ', '.join(f"SUM({col})::INTEGER AS {col}" for col in STAT_FIELDS) + "\n" \
+            "FROM match_rounds WHERE match_id = $1\n" \
+            "GROUP BY steam_id;"
+        rows = await self.fetch(sql, match_id)
+        if not rows or rows[0]['last_round'] < rounds_played:
+            return []
+        return [
+            MatchPlayer.from_stats(match_id, row['steam_id'], row['team'], tuple(row[col] for col in STAT_FIELDS))
+            for row in rows
+        ]
+
+    async def update_players_stats_from_rounds(self, match_id: str, connection=None) -> None:
+        """ Set a match's player_stats to the sums of its timeline, for matches closed without a final stat line. """
+        sql = "UPDATE player_stats ps SET\n" \
+            "    " + ', '.join(f"{col} = t.{col}" for col in STAT_FIELDS) + "\n" \
+            "FROM (\n" \
+            "    SELECT steam_id, " + ', '.join(f"SUM({col}) AS {col}" for col in STAT_FIELDS) + "\n" \
+            "    FROM match_rounds WHERE match_id = $1 GROUP BY steam_id\n" \
+            ") t\n" \
+            "WHERE ps.match_id = $1 AND ps.steam_id = t.steam_id;"
+        if connection:
+            await connection.execute(sql, match_id)
+        else:
+            await self.query(sql, match_id)
+
+    async def fold_match_rounds(self, retention_days: int) -> int:
+        """
+        Fold rounds older than the retention window into one round 0 row per match and player.
+        Sums stay the same, so totals and later round deltas are unaffected. Returns the number of round 0 rows written.
+        """
+        sum_cols = ', '.join(f"SUM({col})" for col in STAT_FIELDS)
+        sql = "WITH folded AS (\n" \
+            "    DELETE FROM match_rounds\n" \
+            "    WHERE round > 0 AND created_at < now() - $1 * INTERVAL '1 day'\n" \
+            "    RETURNING *\n" \
+            ")\n" \
+            f"INSERT INTO match_rounds AS mr (match_id, round, steam_id, team, team1_score, team2_score, {', '.join(STAT_FIELDS)}, created_at)\n" \
+            "SELECT match_id, 0, steam_id,\n" \
+            "    (array_agg(team ORDER BY round DESC))[1],\n" \
+            "    (array_agg(team1_score ORDER BY round DESC))[1],\n" \
+            "    (array_agg(team2_score ORDER BY round DESC))[1],\n" \
+            f"    {sum_cols}, MAX(created_at)\n" \
+            "FROM folded GROUP BY match_id, steam_id\n" \
+            "ON CONFLICT (match_id, round, steam_id) DO UPDATE SET\n" \
+            "    team = EXCLUDED.team, team1_score = EXCLUDED.team1_score, team2_score = EXCLUDED.team2_score,\n" \
+            "    " + ', '.join(f"{col} = mr.{col} + EXCLUDED.{col}" for col in STAT_FIELDS) + ",\n" \
+            "    created_at = EXCLUDED.created_at\n" \
+            "RETURNING match_id;"
+        folded = await self.query(sql, float(retention_days))
+        return len(folded)
 
     async def delete_player_stats(self, user_id: int):
         """"""
-        sql = f'DELETE FROM player_stats WHERE user_id = $1;'
-        await self.query(sql, user_id)
+        async with self.db_pool.acquire() as connection:
+            async with connection.transaction():
+                await connection.execute('DELETE FROM player_stats WHERE user_id = $1;', user_id)
+                await connection.execute('DELETE FROM player_totals WHERE user_id = $1;', user_id)
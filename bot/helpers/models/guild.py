@@ -24,6 +24,18 @@ class GuildModel:
         self.leaderboard_channel = leaderboard_channel
         self.category = category
 
+    @property
+    def referenced_ids(self) -> set:
+        """ IDs of the roles and channels this configuration points at. """
+        objects = [
+            self.linked_role,
+            self.waiting_channel,
+            self.results_channel,
+            self.leaderboard_channel,
+            self.category
+        ]
+        return {obj.id for obj in objects if obj}
+
     @classmethod
     def from_dict(cls, data: dict, guild: discord.Guild) -> "GuildModel":
 
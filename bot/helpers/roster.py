@@ -0,0 +1,94 @@
+# bot/helpers/roster.py
+
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, List
+
+
+class LobbyRoster:
+    """ Authoritative in-memory lobby queues, persisted to lobby_users in the background. """
+
+    def __init__(self, db):
+        self.db = db
+        self.logger = logging.getLogger('DB')
+        self.lobbies: Dict[int, Dict[int, None]] = defaultdict(dict)
+        self._pending: Dict[tuple, bool] = {}
+        self._cleared = set()
+
+    def get(self, lobby_id: int) -> List[int]:
+        """ Return the queued user IDs of a lobby in join order. """
+        return list(self.lobbies.get(lobby_id, ()))
+
+    def add(self, lobby_id: int, user_id: int) -> bool:
+        """ Queue a user, returns False if they are already queued. """
+        if user_id in self.lobbies[lobby_id]:
+            return False
+        self.lobbies[lobby_id][user_id] = None
+        self._pending[(lobby_id, user_id)] = True
+        return True
+
+    def remove(self, lobby_id: int, user_ids: Iterable[int]) -> List[int]:
+        """ Unqueue users and return the IDs that were actually removed. """
+        removed = []
+        roster = self.lobbies.get(lobby_id, {})
+        for user_id in user_ids:
+            if user_id in roster:
+                del roster[user_id]
+                self._pending[(lobby_id, user_id)] = False
+                removed.append(user_id)
+        return removed
+
+    def clear(self, lobby_id: int) -> None:
+        """ Empty a lobby queue. """
+        self.lobbies.pop(lobby_id, None)
+        self._pending = {key: val for key, val in self._pending.items() if key[0] != lobby_id}
+        self._cleared.add(lobby_id)
+
+    def drop(self, lobby_id: int) -> None:
+        """ Forget a deleted lobby, its rows are removed by the foreign key cascade. """
+        self.lobbies.pop(lobby_id, None)
+        self._pending = {key: val for key, val in self._pending.items() if key[0] != lobby_id}
+        self._cleared.discard(lobby_id)
+
+    async def load(self, bot, lobby_channels: Dict[int, int]) -> None:
+        """
+        Rehydrate the rosters from lobby_users, dropping users no longer in the voice channel.
+        Pending changes are flushed first, db_ready can fire again while the bot is running.
+        """
+        await self.flush()
+        if self._pending or self._cleared:
+            self.logger.warning("Keeping the in-memory lobby queues, their pending changes could not be written")
+            return
+
+        rows = await self.db.get_lobbies_users()
+        self.lobbies = defaultdict(dict)
+        self._pending = {}
+        self._cleared = set()
+        channel_ids = {lobby_id: channel_id for channel_id, lobby_id in lobby_channels.items()}
+
+        for lobby_id, user_ids in rows.items():
+            self.lobbies[lobby_id] = dict.fromkeys(user_ids)
+            channel = bot.get_channel(channel_ids.get(lobby_id))
+            connected = {m.id for m in channel.members} if channel else set()
+            stale = [uid for uid in user_ids if uid not in connected]
+            if stale:
+                self.remove(lobby_id, stale)
+
+    async def flush(self) -> None:
+        """ Write pending queue changes to the database in one batch. """
+        if not self._pending and not self._cleared:
+            return
+
+        pending, cleared = self._pending, self._cleared
+        self._pending, self._cleared = {}, set()
+        added = [key for key, present in pending.items() if present]
+        removed = [key for key, present in pending.items() if not present]
+
+        try:
+            await self.db.sync_lobby_users(list(cleared), removed, added)
+        except Exception as e:
+            self.logger.error(e, exc_info=1)
+            # Retry on the next flush, keeping changes made while the batch was in flight.
+            pending = {key: val for key, val in pending.items() if key[0] not in self._cleared}
+            self._pending = {**pending, **self._pending}
+            self._cleared |= cleared
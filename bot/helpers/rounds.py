@@ -0,0 +1,92 @@
+# bot/helpers/rounds.py
+
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Optional
+
+from bot.helpers.api import Match
+
+
+class _MatchRounds:
+    """"""
+
+    __slots__ = ('match_model', 'latest', 'last_edit', 'edit_task', 'counts')
+
+    def __init__(self, match_model):
+        self.match_model = match_model
+        self.latest: Optional[Match] = None
+        self.last_edit = 0.0
+        self.edit_task: Optional[asyncio.Task] = None
+        self.counts = Counter()
+
+
+class RoundCoalescer:
+    """
+    Keeps only the latest round_end state of every live match and edits its scoreboard at most once per edit_interval.
+    """
+
+    def __init__(
+        self,
+        edit_scoreboard: Callable[..., Awaitable],
+        edit_interval: float,
+    ):
+        self.edit_scoreboard = edit_scoreboard
+        self.edit_interval = edit_interval
+        self.logger = logging.getLogger("API")
+        self.matches: Dict[str, _MatchRounds] = {}
+        self.counts = Counter()
+
+    def submit(self, match_model, match_api: Match) -> None:
+        """ Record a round_end state, scheduling a scoreboard edit if none is pending. """
+        state = self.matches.get(match_model.id)
+        if state is None:
+            state = self.matches[match_model.id] = _MatchRounds(match_model)
+        state.counts['rounds'] += 1
+        if state.latest and match_api.rounds_played < state.latest.rounds_played:
+            return
+        state.match_model = match_model
+        state.latest = match_api
+
+        if not state.edit_task:
+            delay = max(0.0, state.last_edit + self.edit_interval - time.monotonic())
+            state.edit_task = asyncio.create_task(self._throttled_edit(state, delay))
+
+    async def _throttled_edit(self, state: _MatchRounds, delay: float) -> None:
+        """ Edit the scoreboard after delay, and again every edit_interval while newer rounds arrive meanwhile. """
+        try:
+            await asyncio.sleep(delay)
+            edited = None
+            while state.latest is not edited:
+                if edited is not None:
+                    await asyncio.sleep(self.edit_interval)
+                edited = state.latest
+                state.last_edit = time.monotonic()
+                state.counts['edits'] += 1
+                try:
+                    await self.edit_scoreboard(state.match_model, edited)
+                except Exception as e:
+                    self.logger.error(e, exc_info=1)
+        finally:
+            # Cleared only once the edit is done, so flush can cancel one that is still in flight
+            state.edit_task = None
+
+    async def flush(self, match_id: str) -> None:
+        """ Cancel a match's scheduled or in-flight scoreboard edit before finalization deletes the message. """
+        state = self.matches.pop(match_id, None)
+        if state is None:
+            return
+
+        if state.edit_task:
+            state.edit_task.cancel()
+            await asyncio.gather(state.edit_task, return_exceptions=True)
+
+        rounds = state.counts['rounds']
+        saved_edits = rounds - state.counts['edits']
+        self.counts['rounds'] += rounds
+        self.counts['saved_edits'] += saved_edits
+        self.logger.info(
+            f"Match #{match_id}: {rounds} round updates, "
+            f"{state.counts['edits']} scoreboard edits ({saved_edits} saved)"
+        )
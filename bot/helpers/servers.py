@@ -0,0 +1,261 @@
+# bot/helpers/servers.py
+
+import asyncio
+import logging
+import secrets
+import time
+from typing import Dict, List, Optional
+
+from bot.helpers.api import GameServer
+from bot.helpers.errors import APIError
+
+
+class GameServerInventory:
+    """ In-memory view of the Dathost game servers with idle servers indexed by location and game mode. """
+
+    def __init__(
+        self,
+        api,
+        db,
+        refresh_interval: float,
+        lease_ttl: float,
+        ready_poll_min: float=0.25,
+        ready_poll_max: float=2,
+        warm_size: int=0,
+        warm_locations: Optional[List[str]]=None,
+        warm_idle_ttl: float=600,
+    ):
+        self.api = api
+        self.db = db
+        self.refresh_interval = refresh_interval
+        self.lease_ttl = lease_ttl
+        self.ready_poll_min = ready_poll_min
+        self.ready_poll_max = ready_poll_max
+        self._ready_waiters: Dict[str, List[asyncio.Future]] = {}
+        self.warm_size = warm_size
+        self.warm_locations = warm_locations or []
+        self.warm_idle_ttl = warm_idle_ttl
+        self.warmed_at: Dict[str, float] = {}
+        self._prewarm_lock: Optional[asyncio.Lock] = None
+        self.leases: Dict[str, str] = {}
+        self.logger = logging.getLogger('API')
+        self.servers: Dict[str, GameServer] = {}
+        self.idle: Dict[tuple, Dict[str, None]] = {}
+        self.busy = set()
+        self._refresh_task = None
+
+    def start(self) -> None:
+        """ Start refreshing the inventory in the background. """
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def close(self) -> None:
+        """ Stop the background refresh. """
+        if self._refresh_task:
+            self._refresh_task.cancel()
+
+    async def _refresh_loop(self) -> None:
+        """"""
+        while True:
+            try:
+                await self.refresh()
+                await self.stop_idle_warm()
+            except Exception as e:
+                self.logger.error(e, exc_info=1)
+            await asyncio.sleep(self.refresh_interval)
+
+    async def refresh(self) -> None:
+        """ Reload every game server from Dathost and rebuild the idle index. """
+        game_servers = await self.api.get_game_servers()
+        self.servers = {}
+        self.idle = {}
+        self.busy = set(self.leases)
+        for game_server in game_servers:
+            self.update(game_server)
+
+    def schedule_refresh(self) -> None:
+        """ Refresh the inventory without waiting for it. """
+        asyncio.create_task(self._safe_refresh())
+
+    async def _safe_refresh(self) -> None:
+        """"""
+        try:
+            await self.refresh()
+        except Exception as e:
+            self.logger.error(e, exc_info=1)
+
+    def update(self, game_server: GameServer) -> None:
+        """ Store the latest state of a game server and reindex it. """
+        self.servers[game_server.id] = game_server
+        self._unindex(game_server.id)
+        if game_server.ip:
+            for future in self._ready_waiters.pop(game_server.id, []):
+                if not future.done():
+                    future.set_result(game_server)
+        if not game_server.booting and not game_server.match_id and game_server.id not in self.busy:
+            key = (game_server.location, game_server.game_mode)
+            self.idle.setdefault(key, {})[game_server.id] = None
+
+    def mark_busy(self, server_id: str) -> None:
+        """ Take a server out of the idle index until the next refresh. """
+        self.busy.add(server_id)
+        self._unindex(server_id)
+
+    def _unindex(self, server_id: str) -> None:
+        """"""
+        for servers in self.idle.values():
+            servers.pop(server_id, None)
+
+    async def wait_ready(self, server_id: str, timeout: float) -> GameServer:
+        """
+        Wait until a game server reports an IP address.
+        Resolves on whichever comes first: an inventory refresh or a short poll that backs off up to ready_poll_max.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._ready_waiters.setdefault(server_id, []).append(future)
+        poller = asyncio.create_task(self._poll_ready(server_id, future))
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        finally:
+            poller.cancel()
+            waiters = self._ready_waiters.get(server_id, [])
+            if future in waiters:
+                waiters.remove(future)
+            if not waiters:
+                self._ready_waiters.pop(server_id, None)
+
+    async def _poll_ready(self, server_id: str, future: asyncio.Future) -> None:
+        """"""
+        delay = self.ready_poll_min
+        while not future.done():
+            try:
+                self.update(await self.api.get_game_server(server_id))
+            except APIError as e:
+                self.logger.warning(f"Unable to poll game server {server_id}: {e}")
+            if future.done():
+                return
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.ready_poll_max)
+
+    def get(self, server_id: str) -> Optional[GameServer]:
+        """ Return the last known state of a game server. """
+        return self.servers.get(server_id)
+
+    def idle_servers(self, location: str=None, game_mode: str=None) -> List[GameServer]:
+        """ Return idle servers, those already matching the location and game mode first. """
+        matching = sorted(self.idle.get((location, game_mode), ()), key=lambda sid: not self.servers[sid].on)
+        others = [sid for key, servers in self.idle.items() if key != (location, game_mode) for sid in servers]
+        return [self.servers[sid] for sid in matching + others]
+
+    def find_idle(self, location: str, game_mode: str) -> Optional[GameServer]:
+        """ Pick an idle server, preferring one that needs no reconfiguration. """
+        idle_servers = self.idle_servers(location, game_mode)
+        return idle_servers[0] if idle_servers else None
+
+    async def reserve(self, location: str, game_mode: str) -> Optional[GameServer]:
+        """
+        Lease the best idle server for a match setup.
+        The lease is taken in the database, so every server is handed out once across all bot processes.
+        """
+        for game_server in self.idle_servers(location, game_mode):
+            if game_server.id in self.busy:
+                continue
+            self.mark_busy(game_server.id)
+            holder = secrets.token_hex(16)
+            if await self.db.acquire_server_lease(game_server.id, holder, self.lease_ttl):
+                self.leases[game_server.id] = holder
+                self.warmed_at.pop(game_server.id, None)
+                return game_server
+
+    async def release(self, server_id: str) -> None:
+        """ Give a reserved server back, e.g. after a failed match setup. """
+        holder = self.leases.pop(server_id, None)
+        self.busy.discard(server_id)
+        await self.db.release_server_lease(server_id, holder)
+        game_server = self.servers.get(server_id)
+        if game_server:
+            self.update(game_server)
+
+    def schedule_prewarm(self, game_mode: str) -> None:
+        """ Pre-warm servers for a game mode without waiting for them to boot. """
+        if self.warm_size and self.warm_locations:
+            asyncio.create_task(self._safe_prewarm(game_mode))
+
+    async def _safe_prewarm(self, game_mode: str) -> None:
+        """"""
+        try:
+            await self.prewarm(game_mode)
+        except Exception as e:
+            self.logger.error(e, exc_info=1)
+
+    def _is_warm(self, game_server: GameServer, location: str, game_mode: str) -> bool:
+        """"""
+        return (game_server.on or game_server.booting or game_server.id in self.warmed_at) \
+            and not game_server.match_id \
+            and game_server.id not in self.busy \
+            and (game_server.location, game_server.game_mode) == (location, game_mode)
+
+    async def prewarm(self, game_mode: str) -> None:
+        """
+        Keep warm_size servers booted and configured for the game mode in every warm pool location.
+        Servers already warm have their idle timer reset, so a busy lobby keeps its pool alive.
+        Calls run one at a time, so joins firing it together can't start the same servers twice.
+        """
+        if self._prewarm_lock is None:
+            self._prewarm_lock = asyncio.Lock()
+        async with self._prewarm_lock:
+            await self._prewarm(game_mode)
+
+    async def _prewarm(self, game_mode: str) -> None:
+        """"""
+        now = time.monotonic()
+        for location in self.warm_locations:
+            warm = [gs for gs in self.servers.values() if self._is_warm(gs, location, game_mode)]
+            for game_server in warm:
+                if game_server.id in self.warmed_at:
+                    self.warmed_at[game_server.id] = now
+
+            missing = self.warm_size - len(warm)
+            if missing <= 0:
+                continue
+
+            cold = [
+                gs for gs in self.idle_servers(location, game_mode)
+                if not gs.on and gs.id not in self.warmed_at
+            ][:missing]
+            # Mark the whole batch before the first await so it counts as warm to anything running meanwhile
+            for game_server in cold:
+                self.warmed_at[game_server.id] = now
+            for game_server in cold:
+                try:
+                    if (game_server.location, game_server.game_mode) != (location, game_mode):
+                        await self.api.update_game_server(game_server.id, game_mode=game_mode, location=location)
+                        game_server.location = location
+                        game_server.game_mode = game_mode
+                    await self.api.start_game_server(game_server.id)
+                except APIError as e:
+                    self.warmed_at.pop(game_server.id, None)
+                    self.logger.warning(f"Unable to pre-warm game server {game_server.id}: {e}")
+                    continue
+                game_server.on = True
+                self.update(game_server)
+                self.logger.info(f"Pre-warming game server {game_server.id} ({location}, {game_mode})")
+
+    async def stop_idle_warm(self) -> None:
+        """ Stop pre-warmed servers that were not picked up by a match within warm_idle_ttl. """
+        now = time.monotonic()
+        for server_id, warmed_at in list(self.warmed_at.items()):
+            game_server = self.servers.get(server_id)
+            if not game_server or game_server.match_id or server_id in self.busy:
+                self.warmed_at.pop(server_id, None)
+                continue
+            if now - warmed_at < self.warm_idle_ttl:
+                continue
+            try:
+                await self.api.stop_game_server(server_id)
+            except APIError as e:
+                self.logger.warning(f"Unable to stop idle game server {server_id}: {e}")
+                continue
+            self.warmed_at.pop(server_id, None)
+            game_server.on = False
+            self.update(game_server)
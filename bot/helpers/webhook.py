@@ -3,6 +3,10 @@ from aiohttp import web
 
 from bot.helpers.api import Match
 from bot.resources import Config
+from bot.helpers import codec
+from bot.helpers.webhook_queue import WebhookQueue
+from bot.helpers.rounds import RoundCoalescer
+from bot.helpers.cache import LRUCache
 from bot.helpers.utils import generate_leaderboard_img, generate_scoreboard_img
 
 
@@ -24,61 +28,111 @@ class WebServer:
         self.host = Config.webserver_host
         self.port = Config.webserver_port
         self.match_cog = self.bot.get_cog("Match")
+        self.queue = WebhookQueue(self.process_event, Config.webhook_workers, Config.webhook_queue_size)
+        self.rounds = RoundCoalescer(self.edit_scoreboard, Config.webhook_edit_interval)
+        self.seen_events = LRUCache(Config.webhook_dedupe_cache_size)
+        self.duplicates = 0
 
-    async def match_end(self, req):
-        self.logger.info(f"Received webhook data from {req.url}")
-        api_key = req.headers.get('Authorization').strip('Bearer ')
-        match_model = await self.bot.db.get_match_by_api_key(api_key)
-        resp_data = await req.json()
-        match_api = Match.from_dict(resp_data)
-        if not match_model or not match_api:
-            return
+    async def _enqueue(self, req, event: str):
+        """ Authenticate a webhook, queue it for the workers and acknowledge it right away. """
+        self.logger.debug(f"Received webhook data from {req.url}")
+        api_key = req.headers.get('Authorization') or ''
+        if api_key.startswith('Bearer '):
+            api_key = api_key[7:]
+        match_model = await self.match_cog.get_match_by_api_key(api_key) if api_key else None
+        if not match_model:
+            return web.Response(status=401)
 
         try:
-            await self.bot.api.stop_game_server(match_model.game_server_id)
-        except Exception as e:
-            self.logger.error(e, exc_info=1)
+            resp_data = await req.json(loads=codec.loads)
+        except ValueError:
+            return web.Response(status=400)
+        match_api = Match.from_payload(resp_data)
+        if not match_api and event == 'round_end':
+            return web.Response(status=400)
+
+        # Late deliveries for a closed match are acknowledged and dropped, its final state is already stored
+        if match_model.finished or match_model.canceled:
+            self.duplicates += 1
+            return web.Response(status=200)
+
+        event_key = self._event_key(match_model, event, match_api)
+        if event_key in self.seen_events:
+            self.duplicates += 1
+            return web.Response(status=200)
+        if self.queue.full:
+            self.logger.warning(f"Webhook queue is full, rejecting {event} for match #{match_model.id}")
+            return web.Response(status=503)
+        if not await self.bot.db.claim_match_event(*event_key):
+            self.seen_events.set(event_key, True)
+            self.duplicates += 1
+            return web.Response(status=200)
+        self.seen_events.set(event_key, True)
+
+        if not self.queue.put(match_model.id, event, match_model, match_api):
+            self.seen_events.pop(event_key)
+            await self.bot.db.release_match_event(*event_key)
+            self.logger.warning(f"Webhook queue is full, rejecting {event} for match #{match_model.id}")
+            return web.Response(status=503)
+        return web.Response(status=202)
 
-        guild_model = await self.bot.db.get_guild_by_id(match_model.guild.id)
-        match_api = await self.bot.api.get_match(match_model.id)
-        await self.match_cog.finalize_match(match_model, match_api, guild_model)
+    async def match_end(self, req):
+        return await self._enqueue(req, 'match_end')
 
     async def round_end(self, req):
-        self.logger.debug(f"Received webhook data from {req.url}")
-        game_server = None
-        message = None
-        api_key = req.headers.get('Authorization').strip('Bearer ')
-        match_model = await self.bot.db.get_match_by_api_key(api_key)
-        resp_data = await req.json()
-        match_api = Match.from_dict(resp_data)
-        # guild_model = await self.bot.db.get_guild_by_id(match_model.guild.id)
-        if not match_model or not match_api:
-            return
+        return await self._enqueue(req, 'round_end')
 
-        for player_stat in match_api.players:
-            try:
-                player_model = await self.bot.db.get_player_by_steam_id(player_stat.steam_id)
-                if player_model:
-                    await self.bot.db.update_player_stats(player_model.discord.id, match_api.id, player_stat.to_dict)
-            except Exception as e:
-                self.logger.error(e, exc_info=1)
+    @staticmethod
+    def _event_key(match_model, event: str, match_api):
+        """"""
+        return (match_model.id, event, match_api.rounds_played if match_api else -1)
 
+    async def process_event(self, event: str, match_model, match_api):
+        """ Run a queued event, forgetting its claim if it fails since Dathost won't deliver it again. """
         try:
-            message = await match_model.text_channel.fetch_message(match_model.message_id)
-        except Exception as e:
-            self.logger.error(e, exc_info=1)
-
+            if event == 'match_end':
+                await self.process_match_end(match_model, match_api)
+            elif event == 'round_end':
+                await self.process_round_end(match_model, match_api)
+        except Exception:
+            event_key = self._event_key(match_model, event, match_api)
+            self.seen_events.pop(event_key)
+            await self.bot.db.release_match_event(*event_key)
+            raise
+
+    async def process_match_end(self, match_model, match_api):
+        """"""
+        self.logger.info(f"Processing match end of match #{match_model.id}")
         try:
-            game_server = await self.bot.api.get_game_server(match_api.game_server_id)
+            await self.bot.api.stop_game_server(match_model.game_server_id)
         except Exception as e:
             self.logger.error(e, exc_info=1)
+        self.bot.servers.schedule_refresh()
+
+        if not match_api or match_api.id != match_model.id or not (match_api.finished or match_api.canceled):
+            self.logger.warning(f"Incomplete match end payload for match #{match_model.id}, refetching")
+            match_api = await self.bot.api.get_match(match_model.id)
+
+        await self.rounds.flush(match_model.id)
+
+        guild_model = await self.bot.db.get_guild_by_id(match_model.guild.id)
+        await self.match_cog.finalize_match(match_model, match_api, guild_model)
+
+    async def process_round_end(self, match_model, match_api):
+        """ Let the coalescer throttle the scoreboard edit and append the round to the match timeline. """
+        # A round_end queued behind its match_end runs after finalization, when there is nothing left to update
+        if match_model.api_key not in self.match_cog.match_routes:
+            self.duplicates += 1
+            return
+        self.rounds.submit(match_model, match_api)
+        await self.bot.db.insert_match_round(match_api)
 
-        if message:
-            try:
-                embed = self.match_cog.embed_match_info(match_api, game_server)
-                await message.edit(embed=embed)
-            except Exception as e:
-                self.logger.error(e, exc_info=1)
+    async def edit_scoreboard(self, match_model, match_api):
+        """ Edit the live match embed with the latest round state and the game server known to the inventory. """
+        game_server = self.bot.servers.get(match_api.game_server_id)
+        message = match_model.text_channel.get_partial_message(match_model.message_id)
+        embed = self.match_cog.embed_match_info(match_api, game_server)
+        await message.edit(embed=embed)
 
     async def start_webhook_server(self):
         if self.server_running:
@@ -94,6 +148,7 @@ class WebServer:
 
         runner = web.AppRunner(app)
         await runner.setup()
+        self.queue.start()
 
         site = web.TCPSite(runner, host=self.host, port=self.port)
 
@@ -0,0 +1,84 @@
+# bot/helpers/webhook_queue.py
+
+import asyncio
+import logging
+import time
+from collections import Counter, defaultdict, deque
+from typing import Awaitable, Callable, Dict, Hashable
+
+from bot.helpers.metrics import Histogram
+
+
+class WebhookQueue:
+    """
+    Bounded queue of webhook events processed by a fixed pool of workers.
+    Events sharing a key run one at a time in arrival order, events with different keys run in parallel.
+    """
+
+    def __init__(self, handler: Callable[..., Awaitable], workers: int, max_depth: int):
+        self.handler = handler
+        self.workers = workers
+        self.max_depth = max_depth
+        self.logger = logging.getLogger("API")
+        self.pending: Dict[Hashable, deque] = {}
+        self.ready = asyncio.Queue()
+        self.depth = 0
+        self.busy = 0
+        self.counts = Counter()
+        self.latency = defaultdict(Histogram)
+        self._tasks = []
+
+    def start(self) -> None:
+        """ Start the worker pool. """
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self) -> None:
+        """ Stop the workers, dropping whatever is still queued. """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    @property
+    def full(self) -> bool:
+        """"""
+        return self.depth >= self.max_depth
+
+    def put(self, key: Hashable, event: str, *args) -> bool:
+        """ Queue an event behind any others with the same key. Returns False when the queue is full. """
+        if self.full:
+            self.counts['rejected'] += 1
+            return False
+
+        events = self.pending.get(key)
+        if events is None:
+            events = self.pending[key] = deque()
+            self.ready.put_nowait(key)
+        events.append((event, args, time.monotonic()))
+        self.depth += 1
+        self.counts['queued'] += 1
+        return True
+
+    async def _worker(self) -> None:
+        """"""
+        while True:
+            key = await self.ready.get()
+            events = self.pending[key]
+            event, args, queued_at = events.popleft()
+            self.busy += 1
+            try:
+                await self.handler(event, *args)
+            except Exception as e:
+                self.counts['failed'] += 1
+                self.logger.error(f"Failed to process {event} webhook for {key}: {e}", exc_info=1)
+            finally:
+                self.busy -= 1
+                self.depth -= 1
+                self.counts['processed'] += 1
+                self.latency[event].observe(time.monotonic() - queued_at)
+                # Requeue the key behind other matches so one busy match can't starve the rest
+                if events:
+                    self.ready.put_nowait(key)
+                else:
+                    del self.pending[key]
@@ -21,10 +21,45 @@ class Config:
     maps = config['bot']['maps']
     dathost_email = config['dathost']['email']
     dathost_password = config['dathost']['password']
+    dathost_base_url = config['dathost'].get('base_url', 'https://dathost.net')
+    dathost_inventory_refresh_interval = config['dathost'].get('inventory_refresh_interval', 60)
+    dathost_server_lease_ttl = config['dathost'].get('server_lease_ttl', 300)
+    dathost_timeout = config['dathost'].get('timeout', 10)
+    dathost_timeouts = config['dathost'].get('timeouts', {})
+    dathost_max_retries = config['dathost'].get('max_retries', 3)
+    dathost_backoff_base = config['dathost'].get('backoff_base', 0.5)
+    dathost_backoff_max = config['dathost'].get('backoff_max', 8)
+    dathost_breaker_threshold = config['dathost'].get('breaker_threshold', 5)
+    dathost_breaker_reset = config['dathost'].get('breaker_reset', 30)
+    dathost_max_concurrency = config['dathost'].get('max_concurrency', 10)
+    dathost_ready_timeout = config['dathost'].get('ready_timeout', 30)
+    dathost_ready_poll_min = config['dathost'].get('ready_poll_min', 0.25)
+    dathost_ready_poll_max = config['dathost'].get('ready_poll_max', 2)
+    dathost_connector_limit = config['dathost'].get('connector', {}).get('limit', 20)
+    dathost_connector_limit_per_host = config['dathost'].get('connector', {}).get('limit_per_host', 10)
+    dathost_connector_dns_ttl = config['dathost'].get('connector', {}).get('ttl_dns_cache', 300)
+    dathost_connector_keepalive = config['dathost'].get('connector', {}).get('keepalive_timeout', 30)
+    dathost_trace_sample_rate = config['dathost'].get('trace_sample_rate', 0.0)
+    dathost_trace_max_bytes = config['dathost'].get('trace_max_bytes', 2048)
+    warm_pool_size = config['dathost'].get('warm_pool', {}).get('size', 0)
+    warm_pool_locations = config['dathost'].get('warm_pool', {}).get('locations', [])
+    warm_pool_fill_ratio = config['dathost'].get('warm_pool', {}).get('fill_ratio', 0.75)
+    warm_pool_idle_ttl = config['dathost'].get('warm_pool', {}).get('idle_ttl', 600)
     webserver_host = config['webserver']['host']
     webserver_port = config['webserver']['port']
+    webhook_workers = config['webserver'].get('workers', 8)
+    webhook_queue_size = config['webserver'].get('queue_size', 1000)
+    webhook_edit_interval = config['webserver'].get('scoreboard_edit_interval', 10)
+    webhook_dedupe_cache_size = config['webserver'].get('dedupe_cache_size', 10000)
+    roster_flush_interval = config['bot'].get('roster_flush_interval', 2)
+    round_retention_days = config['bot'].get('round_retention_days', 30)
+    link_cache_size = config['bot'].get('link_cache_size', 10000)
     POSTGRESQL_USER = config['db']['user']
     POSTGRESQL_PASSWORD = config['db']['password']
     POSTGRESQL_DB = config['db']['database']
     POSTGRESQL_HOST = config['db']['host']
     POSTGRESQL_PORT = config['db']['port']
+    POSTGRESQL_POOL_MIN_SIZE = config['db'].get('pool_min_size', 10)
+    POSTGRESQL_POOL_MAX_SIZE = config['db'].get('pool_max_size', 10)
+    POSTGRESQL_STATEMENT_TIMEOUT = config['db'].get('statement_timeout', 30)
+    POSTGRESQL_STATEMENT_CACHE_SIZE = config['db'].get('statement_cache_size', 100)
@@ -0,0 +1,38 @@
+"""
+Add indexes for hot lookup paths
+"""
+
+from yoyo import step
+
+__depends__ = {'20211226_01_aVejE-create-base-tables'}
+
+# CREATE INDEX CONCURRENTLY cannot run inside a transaction block.
+__transactional__ = False
+
+steps = [
+    step(
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS player_stats_user_match_idx\n'
+        '    ON player_stats (user_id, match_id);',
+        'DROP INDEX CONCURRENTLY IF EXISTS player_stats_user_match_idx;'
+    ),
+    step(
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS player_stats_match_steam_idx\n'
+        '    ON player_stats (match_id, steam_id);',
+        'DROP INDEX CONCURRENTLY IF EXISTS player_stats_match_steam_idx;'
+    ),
+    step(
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS matches_guild_active_idx\n'
+        '    ON matches (guild) WHERE finished = false;',
+        'DROP INDEX CONCURRENTLY IF EXISTS matches_guild_active_idx;'
+    ),
+    step(
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS matches_api_key_idx\n'
+        '    ON matches (api_key);',
+        'DROP INDEX CONCURRENTLY IF EXISTS matches_api_key_idx;'
+    ),
+    step(
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS lobbies_lobby_channel_idx\n'
+        '    ON lobbies (lobby_channel);',
+        'DROP INDEX CONCURRENTLY IF EXISTS lobbies_lobby_channel_idx;'
+    )
+]
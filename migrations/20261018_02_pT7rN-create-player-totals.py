@@ -0,0 +1,50 @@
+"""
+Create player totals table
+"""
+
+from yoyo import step
+
+__depends__ = {'20261018_01_hX3kQ-add-lookup-indexes'}
+
+steps = [
+    step(
+        (
+            'CREATE TABLE player_totals(\n'
+            '    user_id BIGINT PRIMARY KEY REFERENCES users (id) ON DELETE CASCADE,\n'
+            '    steam_id BIGINT DEFAULT NULL,\n'
+            '    kills INTEGER NOT NULL DEFAULT 0,\n'
+            '    deaths INTEGER NOT NULL DEFAULT 0,\n'
+            '    assists INTEGER NOT NULL DEFAULT 0,\n'
+            '    mvps INTEGER NOT NULL DEFAULT 0,\n'
+            '    headshots INTEGER NOT NULL DEFAULT 0,\n'
+            '    k2 INTEGER NOT NULL DEFAULT 0,\n'
+            '    k3 INTEGER NOT NULL DEFAULT 0,\n'
+            '    k4 INTEGER NOT NULL DEFAULT 0,\n'
+            '    k5 INTEGER NOT NULL DEFAULT 0,\n'
+            '    rounds_played INTEGER NOT NULL DEFAULT 0,\n'
+            '    wins INTEGER NOT NULL DEFAULT 0,\n'
+            '    total_matches INTEGER NOT NULL DEFAULT 0\n'
+            ');'
+        ),
+        'DROP TABLE player_totals;'
+    ),
+    step(
+        (
+            'INSERT INTO player_totals\n'
+            'SELECT\n'
+            '    ps.user_id, u.steam_id,\n'
+            '    COALESCE(SUM(ps.kills), 0), COALESCE(SUM(ps.deaths), 0),\n'
+            '    COALESCE(SUM(ps.assists), 0), COALESCE(SUM(ps.mvps), 0),\n'
+            '    COALESCE(SUM(ps.headshots), 0), COALESCE(SUM(ps.k2), 0),\n'
+            '    COALESCE(SUM(ps.k3), 0), COALESCE(SUM(ps.k4), 0),\n'
+            '    COALESCE(SUM(ps.k5), 0), COALESCE(SUM(m.rounds_played), 0),\n'
+            '    COUNT(*) FILTER (WHERE ps.team = m.winner),\n'
+            '    COUNT(*)\n'
+            'FROM player_stats ps\n'
+            'JOIN matches m ON m.id = ps.match_id\n'
+            'JOIN users u ON u.id = ps.user_id\n'
+            'WHERE m.finished = true AND m.canceled = false\n'
+            'GROUP BY ps.user_id, u.steam_id;'
+        )
+    )
+]
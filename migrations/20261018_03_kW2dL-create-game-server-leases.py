@@ -0,0 +1,20 @@
+"""
+Create game server leases table
+"""
+
+from yoyo import step
+
+__depends__ = {'20261018_02_pT7rN-create-player-totals'}
+
+steps = [
+    step(
+        (
+            'CREATE TABLE game_server_leases(\n'
+            '    game_server_id VARCHAR(64) PRIMARY KEY,\n'
+            '    holder VARCHAR(64) NOT NULL,\n'
+            '    expires_at TIMESTAMPTZ NOT NULL\n'
+            ');'
+        ),
+        'DROP TABLE game_server_leases;'
+    )
+]
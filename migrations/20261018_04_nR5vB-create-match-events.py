@@ -0,0 +1,22 @@
+"""
+Create match events table used to deduplicate webhooks
+"""
+
+from yoyo import step
+
+__depends__ = {'20261018_03_kW2dL-create-game-server-leases'}
+
+steps = [
+    step(
+        (
+            'CREATE TABLE match_events(\n'
+            '    match_id VARCHAR(64) REFERENCES matches (id) ON DELETE CASCADE,\n'
+            '    event VARCHAR(16) NOT NULL,\n'
+            '    rounds_played SMALLINT NOT NULL,\n'
+            '    received_at TIMESTAMPTZ NOT NULL DEFAULT now(),\n'
+            '    PRIMARY KEY (match_id, event, rounds_played)\n'
+            ');'
+        ),
+        'DROP TABLE match_events;'
+    )
+]
@@ -0,0 +1,39 @@
+"""
+Create match rounds table holding per-round player stat deltas
+"""
+
+from yoyo import step
+
+__depends__ = {'20261018_04_nR5vB-create-match-events'}
+
+steps = [
+    step(
+        (
+            'CREATE TABLE match_rounds(\n'
+            '    match_id VARCHAR(64) REFERENCES matches (id) ON DELETE CASCADE,\n'
+            '    round SMALLINT NOT NULL,\n'
+            '    steam_id BIGINT NOT NULL,\n'
+            '    team team NOT NULL,\n'
+            '    team1_score SMALLINT NOT NULL,\n'
+            '    team2_score SMALLINT NOT NULL,\n'
+            '    kills SMALLINT NOT NULL DEFAULT 0,\n'
+            '    deaths SMALLINT NOT NULL DEFAULT 0,\n'
+            '    assists SMALLINT NOT NULL DEFAULT 0,\n'
+            '    headshots SMALLINT NOT NULL DEFAULT 0,\n'
+            '    mvps SMALLINT NOT NULL DEFAULT 0,\n'
+            '    k2 SMALLINT NOT NULL DEFAULT 0,\n'
+            '    k3 SMALLINT NOT NULL DEFAULT 0,\n'
+            '    k4 SMALLINT NOT NULL DEFAULT 0,\n'
+            '    k5 SMALLINT NOT NULL DEFAULT 0,\n'
+            '    score SMALLINT NOT NULL DEFAULT 0,\n'
+            '    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),\n'
+            '    PRIMARY KEY (match_id, round, steam_id)\n'
+            ');'
+        ),
+        'DROP TABLE match_rounds;'
+    ),
+    step(
+        'CREATE INDEX match_rounds_created_at_idx ON match_rounds (created_at) WHERE round > 0;',
+        'DROP INDEX match_rounds_created_at_idx;'
+    )
+]
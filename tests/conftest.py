@@ -0,0 +1,13 @@
+# tests/conftest.py
+
+import os
+import shutil
+import sys
+
+
+ROOT = os.path.realpath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+# bot.resources reads config.json at import time, the template's defaults are enough for the tests
+if not os.path.isfile(os.path.join(ROOT, 'config.json')):
+    shutil.copyfile(os.path.join(ROOT, 'config.json.template'), os.path.join(ROOT, 'config.json'))
@@ -0,0 +1,148 @@
+# tests/test_servers.py
+
+import asyncio
+import random
+from collections import Counter
+
+from bot.helpers import servers
+from bot.helpers.api import GameServer
+from bot.helpers.servers import GameServerInventory
+
+
+def make_server(index: int, location: str='dusseldorf') -> GameServer:
+    """"""
+    return GameServer({
+        'id': f'server{index}',
+        'name': f'server{index}',
+        'ip': None,
+        'ports': {'game': 27015 + index, 'gotv': 28015 + index},
+        'on': False,
+        'cs2_settings': {'game_mode': 'competitive'},
+        'location': location,
+        'match_id': None,
+        'booting': False,
+    })
+
+
+class FakeLeaseStore:
+    """ Stands in for the game_server_leases table, shared by every inventory like the database would be. """
+
+    def __init__(self):
+        self.leases = {}
+        self.acquired = Counter()
+
+    async def acquire_server_lease(self, game_server_id: str, holder: str, ttl: float) -> bool:
+        # Yield so concurrent reservations interleave between reading the inventory and taking the lease
+        await asyncio.sleep(random.random() / 1000)
+        if game_server_id in self.leases:
+            return False
+        self.leases[game_server_id] = holder
+        self.acquired[game_server_id] += 1
+        return True
+
+    async def release_server_lease(self, game_server_id: str, holder: str=None) -> None:
+        await asyncio.sleep(0)
+        if holder is None or self.leases.get(game_server_id) == holder:
+            self.leases.pop(game_server_id, None)
+
+
+class FakeServerAPI:
+    """ Stands in for the Dathost game server endpoints, recording the servers it starts, stops and reconfigures. """
+
+    def __init__(self):
+        self.calls = Counter()
+        self.started = []
+        self.stopped = []
+
+    async def update_game_server(self, game_server_id: str, game_mode: str=None, location: str=None):
+        await asyncio.sleep(0)
+        self.calls['update'] += 1
+
+    async def start_game_server(self, game_server_id: str):
+        await asyncio.sleep(0)
+        self.started.append(game_server_id)
+
+    async def stop_game_server(self, game_server_id: str):
+        await asyncio.sleep(0)
+        self.stopped.append(game_server_id)
+
+
+def make_inventory(store: FakeLeaseStore, game_servers, api=None, **kwargs) -> GameServerInventory:
+    """"""
+    inventory = GameServerInventory(api, store, refresh_interval=60, lease_ttl=300, **kwargs)
+    for game_server in game_servers:
+        inventory.update(game_server)
+    return inventory
+
+
+def test_concurrent_reservations_hand_out_each_server_once():
+    """ 50 simultaneous setups, split over two bot processes, against 20 idle servers. """
+    async def run():
+        store = FakeLeaseStore()
+        locations = ['dusseldorf', 'stockholm']
+        inventories = [
+            make_inventory(store, [make_server(i, locations[i % 2]) for i in range(20)])
+            for _ in range(2)
+        ]
+        return store, await asyncio.gather(*[
+            inventories[i % 2].reserve(locations[i % 3 % 2], 'competitive') for i in range(50)
+        ])
+
+    store, reserved = asyncio.run(run())
+    server_ids = [game_server.id for game_server in reserved if game_server]
+    assert len(server_ids) == 20
+    assert len(set(server_ids)) == len(server_ids)
+    assert all(count == 1 for count in store.acquired.values())
+
+
+def test_released_server_can_be_reserved_again():
+    async def run():
+        store = FakeLeaseStore()
+        inventory = make_inventory(store, [make_server(0)])
+        first = await inventory.reserve('dusseldorf', 'competitive')
+        assert await inventory.reserve('dusseldorf', 'competitive') is None
+        await inventory.release(first.id)
+        assert not inventory.leases and first.id not in inventory.busy
+        return first, await inventory.reserve('dusseldorf', 'competitive')
+
+    first, second = asyncio.run(run())
+    assert second is not None and second.id == first.id
+
+
+def test_warm_pool_is_used_and_stopped_after_idle_ttl(monkeypatch):
+    """ A full lobby pre-warms two servers, a match takes one and the other is stopped once it idled past the TTL. """
+    clock = [1000.0]
+    monkeypatch.setattr(servers.time, 'monotonic', lambda: clock[0])
+
+    async def run():
+        store = FakeLeaseStore()
+        api = FakeServerAPI()
+        inventory = make_inventory(
+            store,
+            [make_server(i, ('stockholm', 'dusseldorf')[i % 2]) for i in range(6)],
+            api=api,
+            warm_size=2,
+            warm_locations=['dusseldorf'],
+            warm_idle_ttl=600
+        )
+
+        # Joins firing together start the pool once
+        await asyncio.gather(*[inventory.prewarm('competitive') for _ in range(4)])
+        assert len(api.started) == 2
+        assert all(inventory.get(server_id).location == 'dusseldorf' for server_id in api.started)
+        assert api.calls['update'] == 0
+
+        game_server = await inventory.reserve('dusseldorf', 'competitive')
+        assert game_server.id in api.started and game_server.on
+        assert game_server.id not in inventory.warmed_at
+
+        clock[0] += 599
+        await inventory.stop_idle_warm()
+        assert api.stopped == []
+
+        clock[0] += 2
+        await inventory.stop_idle_warm()
+        return api, game_server
+
+    api, game_server = asyncio.run(run())
+    assert api.stopped == [server_id for server_id in api.started if server_id != game_server.id]
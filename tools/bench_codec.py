@@ -0,0 +1,52 @@
+# tools/bench_codec.py
+
+"""
+Time parsing and serializing cs2-matches payloads with the stdlib json module and with bot.helpers.codec.
+
+The payloads are a match recorded with tools/fake_dathost.py, as the response bodies of the cs2-matches
+endpoint, one per round. The codec uses orjson when it is installed, otherwise both columns run the stdlib:
+
+    python -m tools.bench_codec --players 10 --number 2000
+"""
+
+import argparse
+import json
+import timeit
+
+from bot.helpers import codec
+from tools.fake_dathost import record_match
+
+
+def bench(func, bodies: list, number: int) -> float:
+    """ Best mean time per body over five runs of number passes. """
+    runs = timeit.repeat(lambda: [func(body) for body in bodies], number=number, repeat=5)
+    return min(runs) / number / len(bodies)
+
+
+def main(args):
+    payloads = record_match(args.rounds, args.players, args.seed)
+    bodies = [json.dumps(payload).encode() for payload in payloads]
+    size = sum(len(body) for body in bodies) / len(bodies)
+    print(f"{len(bodies)} cs2-matches bodies of {size:.0f} bytes on average, "
+          f"codec backend: {'orjson' if codec.orjson else 'json'}")
+
+    for label, stdlib, current, data in (
+        ('loads', json.loads, codec.loads, bodies),
+        ('dumps', lambda obj: json.dumps(obj, ensure_ascii=False), codec.dumps, payloads),
+    ):
+        before = bench(stdlib, data, args.number)
+        after = bench(current, data, args.number)
+        print(f"{label}: json {before * 1e6:.1f}us, codec {after * 1e6:.1f}us ({before / after:.1f}x)")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Micro-benchmark the JSON codec on cs2-matches payloads.")
+    parser.add_argument('--rounds', type=int, default=24, help="Rounds in the recorded match")
+    parser.add_argument('--players', type=int, default=10, help="Players in the recorded match")
+    parser.add_argument('--seed', type=int, default=0, help="Seed the match is recorded with")
+    parser.add_argument('--number', type=int, default=500, help="Passes over the bodies per run")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,228 @@
+# tools/bench_db.py
+
+"""
+Count the database round trips and time the read helpers of DBManager, before and after the query layer split.
+
+"before" runs the helpers on the original query path, a transaction and an explicit prepare around every read
+with the rows copied into dicts. "after" runs them on the current fetch/fetchrow/fetchval methods, which use the
+pool's statement cache outside of a transaction. The connection goes through a local proxy that counts the
+messages PostgreSQL answers (Sync and simple Query), so the round trips include the pool's reset on release.
+The guild and link caches are cleared before every call so each one reaches the database:
+
+    python -m tools.bench_db --iterations 500
+
+Use a development database, the rows the benchmark creates are deleted when it finishes.
+"""
+
+import argparse
+import asyncio
+import struct
+import time
+from types import SimpleNamespace
+
+from bot.resources import Config
+from bot.helpers.db import DBManager
+from tools.fake_discord import FakeChannel, FakeGuild
+
+
+GUILD_ID = 9_200_000_000_000_000_000
+USER_ID = 9_200_000_000_000_000_000
+STEAM_ID = 9_210_000_000_000_000_000
+LOBBY_CHANNEL_ID = 9_200_000_000_000_000_001
+MATCH_ID = 'bench-db-match'
+API_KEY = 'bench-db-api-key'
+# Startup packets without a message type that ask for an encrypted connection
+ENCRYPTION_REQUESTS = (80877103, 80877104)
+
+
+class RoundTripProxy:
+    """ TCP proxy in front of PostgreSQL counting the client messages that wait for a server reply. """
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.round_trips = 0
+        self.server = None
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, client_reader, client_writer):
+        server_reader, server_writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            await asyncio.gather(
+                self._client_to_server(client_reader, client_writer, server_writer),
+                self._server_to_client(server_reader, client_writer)
+            )
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            server_writer.close()
+            client_writer.close()
+
+    async def _client_to_server(self, client_reader, client_writer, server_writer):
+        # Refuse encryption so the rest of the stream can be read
+        while True:
+            header = await client_reader.readexactly(8)
+            length, code = struct.unpack('!ii', header)
+            body = await client_reader.readexactly(length - 8)
+            if code not in ENCRYPTION_REQUESTS:
+                server_writer.write(header + body)
+                break
+            client_writer.write(b'N')
+            await client_writer.drain()
+
+        while True:
+            header = await client_reader.readexactly(5)
+            body = await client_reader.readexactly(struct.unpack('!i', header[1:])[0] - 4)
+            if header[:1] in (b'S', b'Q'):
+                self.round_trips += 1
+            server_writer.write(header + body)
+            await server_writer.drain()
+            if header[:1] == b'X':
+                return
+
+    @staticmethod
+    async def _server_to_client(server_reader, client_writer):
+        while True:
+            data = await server_reader.read(65536)
+            if not data:
+                return
+            client_writer.write(data)
+            await client_writer.drain()
+
+
+class LegacyDBManager(DBManager):
+    """ DBManager with the read methods on the original query path. """
+
+    async def query(self, sql, *args):
+        async with self.db_pool.acquire() as connection:
+            async with connection.transaction():
+                prepared_stmt = await connection.prepare(sql)
+                result = await prepared_stmt.fetch(*args)
+                return [dict(row.items()) for row in result]
+
+    async def fetch(self, sql, *args):
+        return await self.query(sql, *args)
+
+    async def fetchrow(self, sql, *args):
+        rows = await self.query(sql, *args)
+        return rows[0] if rows else None
+
+    async def fetchval(self, sql, *args, column: int=0):
+        row = await self.fetchrow(sql, *args)
+        return list(row.values())[column] if row else None
+
+
+def helpers(db: DBManager, guild: FakeGuild):
+    """ The read helpers to measure, each clearing the cache in front of it. """
+    channel = FakeChannel(guild, 'lobby', LOBBY_CHANNEL_ID)
+
+    async def get_guild_by_id():
+        db.guild_cache.clear()
+        return await db.get_guild_by_id(GUILD_ID)
+
+    async def get_player_by_discord_id():
+        db.link_cache.clear()
+        return await db.get_player_by_discord_id(USER_ID)
+
+    return {
+        'get_guild_by_id': get_guild_by_id,
+        'get_lobby_by_channel': lambda: db.get_lobby_by_channel(channel),
+        'get_match_by_api_key': lambda: db.get_match_by_api_key(API_KEY),
+        'get_player_by_discord_id': get_player_by_discord_id,
+        'get_players_stats': lambda: db.get_players_stats([USER_ID]),
+    }
+
+
+async def seed(db: DBManager) -> None:
+    """"""
+    await db.query(
+        "INSERT INTO guilds (id, waiting_channel, results_channel) VALUES ($1, 1, 2)\n"
+        "ON CONFLICT (id) DO NOTHING;",
+        GUILD_ID
+    )
+    await db.query(
+        "INSERT INTO users (id, steam_id) VALUES ($1, $2) ON CONFLICT DO NOTHING;",
+        USER_ID, STEAM_ID
+    )
+    await db.query(
+        "INSERT INTO lobbies (guild, lobby_channel) VALUES ($1, $2);",
+        GUILD_ID, LOBBY_CHANNEL_ID
+    )
+    await db.query(
+        "INSERT INTO matches (id, game_server_id, guild, message, category, team1_channel, team2_channel, api_key)\n"
+        "VALUES ($1, 'bench', $2, 1, 1, 1, 1, $3);",
+        MATCH_ID, GUILD_ID, API_KEY
+    )
+
+
+async def cleanup(db: DBManager) -> None:
+    """ Delete the benchmark rows, lobbies and matches go with the guild. """
+    await db.query("DELETE FROM guilds WHERE id = $1;", GUILD_ID)
+    await db.query("DELETE FROM users WHERE id = $1;", USER_ID)
+
+
+async def measure(db_class, proxy: RoundTripProxy, args) -> dict:
+    """ Run every helper on a fresh single connection pool and return its round trips and latency per call. """
+    guild = FakeGuild(GUILD_ID)
+    bot = SimpleNamespace(get_guild=lambda guild_id: guild, get_user=lambda user_id: None)
+    db = db_class(bot)
+    await db.connect()
+    results = {}
+    try:
+        for name, helper in helpers(db, guild).items():
+            if await helper() is None:
+                raise SystemExit(f"{name} found no benchmark row.")
+            for _ in range(args.warmup):
+                await helper()
+            proxy.round_trips = 0
+            start = time.perf_counter()
+            for _ in range(args.iterations):
+                await helper()
+            elapsed = time.perf_counter() - start
+            results[name] = (proxy.round_trips / args.iterations, elapsed / args.iterations)
+    finally:
+        await db.close()
+    return results
+
+
+async def main(args):
+    proxy = RoundTripProxy(Config.POSTGRESQL_HOST, Config.POSTGRESQL_PORT)
+    Config.POSTGRESQL_HOST = '127.0.0.1'
+    Config.POSTGRESQL_PORT = await proxy.start()
+    # One connection, so every call pays the same acquire and release
+    Config.POSTGRESQL_POOL_MIN_SIZE = Config.POSTGRESQL_POOL_MAX_SIZE = 1
+
+    setup = DBManager(None)
+    await setup.connect()
+    try:
+        await cleanup(setup)
+        await seed(setup)
+        before = await measure(LegacyDBManager, proxy, args)
+        after = await measure(DBManager, proxy, args)
+    finally:
+        await cleanup(setup)
+        await setup.close()
+        await proxy.close()
+
+    print(f"{'helper':<28}{'trips before':>14}{'trips after':>13}{'before':>12}{'after':>12}")
+    for name in before:
+        print(f"{name:<28}{before[name][0]:>14.1f}{after[name][0]:>13.1f}"
+              f"{before[name][1] * 1e6:>10.0f}us{after[name][1] * 1e6:>10.0f}us")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Count database round trips of the DBManager read helpers.")
+    parser.add_argument('--iterations', type=int, default=500, help="Calls per helper")
+    parser.add_argument('--warmup', type=int, default=50, help="Uncounted calls per helper first")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
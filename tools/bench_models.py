@@ -0,0 +1,130 @@
+# tools/bench_models.py
+
+"""
+Time and size the Dathost match models on round-end payloads, before and after they became slotted and lazy.
+
+"before" is the original eager Match and MatchPlayer, copied below, which copy every field of the payload into
+an instance __dict__. "after" is bot.helpers.api.Match, with the stats read by name and as the stat vector the
+database helpers use. Each run does what a webhook does, from_payload plus a read of the match fields and of every
+player's stats, and tracemalloc reports the memory the parsed matches keep:
+
+    python -m tools.bench_models --players 10 --number 2000
+"""
+
+import argparse
+import timeit
+import tracemalloc
+from typing import Optional
+
+from bot.helpers.api import Match
+from tools.fake_dathost import record_match
+
+
+class LegacyMatchPlayer:
+    """"""
+
+    def __init__(self, data):
+        self.match_id = data['match_id']
+        self.steam_id = int(data['steam_id_64'])
+        self.team = data['team']
+        self.kills = data['stats']['kills']
+        self.assists = data['stats']['assists']
+        self.headshots = data['stats']['kills_with_headshot']
+        self.deaths = data['stats']['deaths']
+        self.mvps = data['stats']['mvps']
+        self.k2 = data['stats']['2ks']
+        self.k3 = data['stats']['3ks']
+        self.k4 = data['stats']['4ks']
+        self.k5 = data['stats']['5ks']
+        self.score = data['stats']['score']
+
+
+class LegacyMatch:
+    """"""
+
+    def __init__(self, match_data: dict) -> None:
+        self.id = match_data['id']
+        self.game_server_id = match_data['game_server_id']
+        self.team1_name = match_data['team1']['name']
+        self.team2_name = match_data['team2']['name']
+        self.team1_score = match_data['team1']['stats']['score']
+        self.team2_score = match_data['team2']['stats']['score']
+        self.canceled = match_data['cancel_reason'] is not None
+        self.finished = match_data['finished']
+        self.connect_time = match_data['settings']['connect_time']
+        self.map_name = match_data['settings']['map']
+        self.rounds_played = match_data['rounds_played']
+        self.players = [LegacyMatchPlayer(player) for player in match_data['players']]
+
+    @classmethod
+    def from_payload(cls, data: dict) -> Optional["LegacyMatch"]:
+        try:
+            return cls(data)
+        except (KeyError, TypeError, ValueError):
+            return None
+
+
+def named_stats(player) -> tuple:
+    """ Read a player's stats one attribute at a time, as the database helpers did before the stat vectors. """
+    return (player.kills, player.deaths, player.assists, player.headshots, player.mvps,
+            player.k2, player.k3, player.k4, player.k5, player.score)
+
+
+def stat_vector(player) -> tuple:
+    """ Read a player's stats the way update_players_stats and insert_match_round do now. """
+    return player.stats
+
+
+def handle(match_class, read_stats, payload: dict):
+    """ Parse a payload and read the fields and stats a round-end webhook uses. """
+    match = match_class.from_payload(payload)
+    match.id, match.game_server_id, match.team1_score, match.team2_score, match.rounds_played
+    match.canceled, match.finished, match.map_name
+    for player in match.players:
+        player.steam_id, player.team, read_stats(player)
+    return match
+
+
+def bench(match_class, read_stats, payloads: list, number: int) -> float:
+    """ Best mean time per payload over five runs of number passes. """
+    runs = timeit.repeat(
+        lambda: [handle(match_class, read_stats, payload) for payload in payloads], number=number, repeat=5)
+    return min(runs) / number / len(payloads)
+
+
+def retained(match_class, read_stats, payloads: list) -> float:
+    """ Bytes the parsed matches keep alive beyond their payloads, per match. """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    matches = [handle(match_class, read_stats, payload) for payload in payloads]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del matches
+    return (after - before) / len(payloads)
+
+
+def main(args):
+    payloads = record_match(args.rounds, args.players, args.seed)
+    print(f"{len(payloads)} round-end payloads with {args.players} players")
+    print(f"{'model':<24}{'parse + read':>14}{'retained':>14}")
+    for label, match_class, read_stats in (
+        ('before', LegacyMatch, named_stats),
+        ('after, named stats', Match, named_stats),
+        ('after, stat vector', Match, stat_vector),
+    ):
+        per_payload = bench(match_class, read_stats, payloads, args.number)
+        size = retained(match_class, read_stats, payloads)
+        print(f"{label:<24}{per_payload * 1e6:>12.1f}us{size:>8.0f} bytes")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the Dathost match models on round-end payloads.")
+    parser.add_argument('--rounds', type=int, default=24, help="Rounds in the recorded match")
+    parser.add_argument('--players', type=int, default=10, help="Players in the recorded match")
+    parser.add_argument('--seed', type=int, default=0, help="Seed the match is recorded with")
+    parser.add_argument('--number', type=int, default=500, help="Passes over the payloads per run")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,154 @@
+# tools/bench_round_end.py
+
+"""
+Replay a recorded match's round-end webhooks against the database and time the writes each round costs.
+
+The payloads come from tools/fake_dathost.py playing a match offline. Every round is replayed three ways:
+
+    per player   the original handler, a users lookup and an UPDATE of player_stats for every player
+    batched      DBManager.update_players_stats, one UPDATE ... FROM unnest(...) for all players
+    timeline     DBManager.insert_match_round, the single INSERT the round_end handler runs now
+
+The connection goes through the counting proxy of tools/bench_db.py, so round trips are reported too:
+
+    python -m tools.bench_round_end --matches 20 --rounds 24
+
+Use a development database, the rows the benchmark creates are deleted when it finishes.
+"""
+
+import argparse
+import asyncio
+import time
+from types import SimpleNamespace
+
+from bot.resources import Config
+from bot.helpers.api import Match, STAT_FIELDS
+from bot.helpers.db import DBManager
+from tools.bench_db import RoundTripProxy
+from tools.fake_dathost import record_match
+
+
+GUILD_ID = 9_220_000_000_000_000_000
+FIRST_USER_ID = 9_220_000_000_000_000_000
+FIRST_STEAM_ID = 9_221_000_000_000_000_000
+
+
+def percentile(values, q):
+    """"""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def per_player(db: DBManager, match_api: Match) -> None:
+    """ The round_end handler before the batched update, one lookup and one update per player. """
+    for player_stat in match_api.players:
+        data = await db.fetchrow("SELECT * FROM users\n    WHERE steam_id = $1;", player_stat.steam_id)
+        if data:
+            col_vals = ",\n    ".join(f"{key} = {val}" for key, val in zip(STAT_FIELDS, player_stat.stats))
+            sql = f'UPDATE player_stats SET {col_vals} WHERE user_id = $1 AND match_id = $2;'
+            await db.query(sql, data['id'], match_api.id)
+
+
+async def batched(db: DBManager, match_api: Match) -> None:
+    """"""
+    await db.update_players_stats(match_api.id, match_api.players)
+
+
+async def timeline(db: DBManager, match_api: Match) -> None:
+    """"""
+    await db.insert_match_round(match_api)
+
+
+MODES = {'per player': per_player, 'batched': batched, 'timeline': timeline}
+
+
+async def seed(db: DBManager, payloads: list) -> None:
+    """ Create the guild, the players and the match row with one player_stats row per player. """
+    match_id = payloads[0]['id']
+    steam_ids = [int(player['steam_id_64']) for player in payloads[0]['players']]
+    user_ids = [FIRST_USER_ID + i for i in range(len(steam_ids))]
+    await db.query("INSERT INTO guilds (id) VALUES ($1) ON CONFLICT (id) DO NOTHING;", GUILD_ID)
+    await db.query(
+        "INSERT INTO users (id, steam_id) SELECT * FROM unnest($1::BIGINT[], $2::BIGINT[])\n"
+        "ON CONFLICT DO NOTHING;",
+        user_ids, steam_ids
+    )
+    await db.query(
+        "INSERT INTO matches (id, game_server_id, guild) VALUES ($1, $2, $3);",
+        match_id, payloads[0]['game_server_id'], GUILD_ID
+    )
+    await db.insert_players_stats([
+        {'match_id': match_id, 'steam_id': steam_id, 'user_id': user_id, 'team': player['team']}
+        for steam_id, user_id, player in zip(steam_ids, user_ids, payloads[0]['players'])
+    ])
+
+
+async def reset(db: DBManager, match_id: str) -> None:
+    """ Clear what a replay wrote, so every replay starts from the match's first round. """
+    await db.query("DELETE FROM match_rounds WHERE match_id = $1;", match_id)
+    await db.query(
+        f"UPDATE player_stats SET {', '.join(f'{col} = 0' for col in STAT_FIELDS)} WHERE match_id = $1;",
+        match_id
+    )
+
+
+async def cleanup(db: DBManager, match_id: str) -> None:
+    """ Delete the benchmark rows, the match and its stats go with the guild. """
+    await db.query("DELETE FROM match_rounds WHERE match_id = $1;", match_id)
+    await db.query("DELETE FROM guilds WHERE id = $1;", GUILD_ID)
+    await db.query("DELETE FROM users WHERE id >= $1 AND id < $1 + 1000;", FIRST_USER_ID)
+
+
+async def main(args):
+    payloads = record_match(args.rounds, args.players, args.seed, FIRST_STEAM_ID)[:-1]
+    matches = [Match.from_payload(payload) for payload in payloads]
+    match_id = payloads[0]['id']
+
+    proxy = RoundTripProxy(Config.POSTGRESQL_HOST, Config.POSTGRESQL_PORT)
+    Config.POSTGRESQL_HOST = '127.0.0.1'
+    Config.POSTGRESQL_PORT = await proxy.start()
+    Config.POSTGRESQL_POOL_MIN_SIZE = Config.POSTGRESQL_POOL_MAX_SIZE = 1
+
+    db = DBManager(SimpleNamespace(get_user=lambda user_id: None))
+    await db.connect()
+    results = {}
+    try:
+        await cleanup(db, match_id)
+        await seed(db, payloads)
+        for name, replay in MODES.items():
+            latencies = []
+            round_trips = 0
+            for _ in range(args.matches):
+                await reset(db, match_id)
+                proxy.round_trips = 0
+                for match_api in matches:
+                    start = time.perf_counter()
+                    await replay(db, match_api)
+                    latencies.append(time.perf_counter() - start)
+                round_trips += proxy.round_trips
+            results[name] = (latencies, round_trips / len(latencies))
+    finally:
+        await cleanup(db, match_id)
+        await db.close()
+        await proxy.close()
+
+    print(f"Replayed {args.matches} x {args.rounds} rounds with {args.players} players, per round:")
+    print(f"{'mode':<14}{'trips':>8}{'p50':>10}{'p95':>10}{'mean':>10}{'per match':>12}")
+    for name, (latencies, round_trips) in results.items():
+        mean = sum(latencies) / len(latencies)
+        print(f"{name:<14}{round_trips:>8.1f}" + ''.join(
+            f"{value * 1000:>8.2f}ms" for value in (percentile(latencies, 0.5), percentile(latencies, 0.95), mean)
+        ) + f"{mean * args.rounds * 1000:>10.1f}ms")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay round-end webhooks against the database.")
+    parser.add_argument('--matches', type=int, default=20, help="Times the recorded match is replayed per mode")
+    parser.add_argument('--rounds', type=int, default=24, help="Rounds in the recorded match")
+    parser.add_argument('--players', type=int, default=10, help="Players in the recorded match")
+    parser.add_argument('--seed', type=int, default=0, help="Seed the match is recorded with")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
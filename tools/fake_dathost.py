@@ -0,0 +1,317 @@
+# tools/fake_dathost.py
+
+"""
+Local stand-in for the Dathost endpoints used by APIManager.
+
+Run it and point `dathost.base_url` in config.json at it:
+
+    python tools/fake_dathost.py --port 8080 --servers 20 --latency 0.05 --failure-rate 0.02
+
+Besides the Dathost API it exposes two control endpoints:
+    POST /fake/cs2-matches/{id}/play   play the match out, firing round-end and match-end webhooks
+    GET  /fake/stats                   webhook delivery latencies and response statuses recorded so far
+"""
+
+import argparse
+import asyncio
+import copy
+import random
+import time
+import uuid
+from collections import Counter
+
+from aiohttp import web, ClientSession, ClientTimeout
+
+
+LOCATIONS = ['dusseldorf', 'stockholm', 'amsterdam', 'new_york_city', 'los_angeles', 'singapore']
+MAPS = ['de_dust2', 'de_mirage', 'de_inferno', 'de_nuke', 'de_overpass', 'de_ancient', 'de_anubis']
+STATS = ('kills', 'assists', 'kills_with_headshot', 'deaths', 'mvps', '2ks', '3ks', '4ks', '5ks', 'score')
+
+
+class FakeDathost:
+    """ In-memory game servers and matches that mimic the Dathost JSON shapes. """
+
+    def __init__(self, servers: int, latency: float, jitter: float, failure_rate: float, boot_time: float):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.boot_time = boot_time
+        self.matches = {}
+        self.webhook_latency = {'round_end': [], 'match_end': []}
+        self.webhook_statuses = {'round_end': Counter(), 'match_end': Counter()}
+        self.webhook_errors = 0
+        self.servers = {}
+        for i in range(servers):
+            server_id = uuid.uuid4().hex[:24]
+            self.servers[server_id] = {
+                'id': server_id,
+                'name': f'fake-{i}',
+                'game': 'cs2',
+                'ip': None,
+                'ports': {'game': 27015 + i, 'gotv': 28015 + i},
+                'on': False,
+                'booting': False,
+                'location': LOCATIONS[i % len(LOCATIONS)],
+                'match_id': None,
+                'cs2_settings': {'game_mode': 'competitive'},
+            }
+        self.session = None
+
+    @web.middleware
+    async def inject(self, request, handler):
+        """ Add latency to every API call and fail a share of them with 503. """
+        if request.path.startswith('/api/'):
+            await asyncio.sleep(max(0, random.gauss(self.latency, self.jitter)))
+            if random.random() < self.failure_rate:
+                return web.Response(status=503, text='Injected failure')
+        return await handler(request)
+
+    def _server(self, request) -> dict:
+        """"""
+        server = self.servers.get(request.match_info['server_id'])
+        if not server:
+            raise web.HTTPNotFound()
+        return server
+
+    def _match(self, request) -> dict:
+        """"""
+        match = self.matches.get(request.match_info['match_id'])
+        if not match:
+            raise web.HTTPNotFound()
+        return match
+
+    def _boot(self, server: dict) -> None:
+        """"""
+        if server['on']:
+            return
+        server['on'] = True
+        server['booting'] = True
+
+        def booted():
+            server['booting'] = False
+            server['ip'] = '127.0.0.1'
+
+        asyncio.get_running_loop().call_later(self.boot_time, booted)
+
+    async def list_servers(self, request):
+        return web.json_response(list(self.servers.values()))
+
+    async def get_server(self, request):
+        return web.json_response(self._server(request))
+
+    async def update_server(self, request):
+        server = self._server(request)
+        data = await request.post()
+        if 'location' in data:
+            server['location'] = data['location']
+        if 'cs2_settings.game_mode' in data:
+            server['cs2_settings']['game_mode'] = data['cs2_settings.game_mode']
+        return web.Response()
+
+    async def start_server(self, request):
+        self._boot(self._server(request))
+        return web.Response()
+
+    async def stop_server(self, request):
+        server = self._server(request)
+        server.update(on=False, booting=False, ip=None, match_id=None)
+        return web.Response()
+
+    async def create_match(self, request):
+        data = await request.json()
+        server = self.servers.get(data['game_server_id'])
+        if not server:
+            return web.Response(status=400, text='Unknown game server')
+        if server['match_id']:
+            return web.Response(status=400, text='Game server is busy')
+
+        match_id = uuid.uuid4().hex[:24]
+        match = {
+            'id': match_id,
+            'game_server_id': server['id'],
+            'team1': {'name': data['team1']['name'], 'stats': {'score': 0}},
+            'team2': {'name': data['team2']['name'], 'stats': {'score': 0}},
+            'cancel_reason': None,
+            'finished': False,
+            'rounds_played': 0,
+            'settings': {
+                'map': data['settings']['map'],
+                'connect_time': data['settings']['connect_time'],
+            },
+            'webhooks': data.get('webhooks', {}),
+            'players': [],
+        }
+        for player in data.get('players', []):
+            match['players'].append(self._player(match_id, player['steam_id_64'], player['team']))
+        self.matches[match_id] = match
+        server['match_id'] = match_id
+        self._boot(server)
+        return web.json_response(self._public(match))
+
+    async def get_match(self, request):
+        return web.json_response(self._public(self._match(request)))
+
+    async def add_match_player(self, request):
+        match = self._match(request)
+        data = await request.json()
+        player = self._player(match['id'], data['steam_id_64'], data['team'])
+        match['players'] = [p for p in match['players'] if p['steam_id_64'] != player['steam_id_64']]
+        match['players'].append(player)
+        return web.json_response(player)
+
+    async def cancel_match(self, request):
+        match = self._match(request)
+        match['cancel_reason'] = 'CANCELED_BY_USER'
+        match['finished'] = True
+        self.servers[match['game_server_id']]['match_id'] = None
+        return web.json_response(self._public(match))
+
+    async def play_match(self, request):
+        """ Play a match round by round, posting each webhook and waiting for the bot to answer it. """
+        match = self._match(request)
+        rounds = int(request.query.get('rounds', 24))
+        interval = float(request.query.get('interval', 0))
+        webhooks = match['webhooks']
+
+        for _ in range(rounds):
+            if match['finished']:
+                break
+            self._play_round(match)
+            await self._send_webhook('round_end', webhooks.get('round_end_url'), webhooks, match)
+            await asyncio.sleep(interval)
+
+        if not match['finished']:
+            match['finished'] = True
+            await self._send_webhook('match_end', webhooks.get('match_end_url'), webhooks, match)
+        self.servers[match['game_server_id']]['match_id'] = None
+        return web.json_response(self._public(match))
+
+    async def stats(self, request):
+        return web.json_response({
+            'webhook_latency': self.webhook_latency,
+            'webhook_statuses': self.webhook_statuses,
+            'webhook_errors': self.webhook_errors,
+        })
+
+    def _play_round(self, match: dict) -> None:
+        """"""
+        match['rounds_played'] += 1
+        winner = random.choice(('team1', 'team2'))
+        match[winner]['stats']['score'] += 1
+        for player in match['players']:
+            stats = player['stats']
+            if player['team'] == winner:
+                kills = random.randint(0, 3)
+                stats['kills'] += kills
+                stats['kills_with_headshot'] += random.randint(0, kills)
+                stats['score'] += kills * 2
+                if kills >= 2:
+                    stats[f'{kills}ks'] += 1
+            elif player['team'] != 'spectator':
+                stats['deaths'] += 1
+                stats['assists'] += random.randint(0, 1)
+
+    async def _send_webhook(self, event: str, url: str, webhooks: dict, match: dict) -> None:
+        """ Post a webhook, recording its latency only when the bot accepted it. """
+        if not url:
+            return
+        start = time.monotonic()
+        try:
+            async with self.session.post(
+                url,
+                json=self._public(match),
+                headers={'Authorization': webhooks.get('authorization_header', '')}
+            ) as resp:
+                await resp.read()
+                status = resp.status
+        except Exception as e:
+            status = type(e).__name__
+        self.webhook_statuses[event][status] += 1
+        if isinstance(status, int) and 200 <= status < 300:
+            self.webhook_latency[event].append(time.monotonic() - start)
+        else:
+            self.webhook_errors += 1
+
+    @staticmethod
+    def _player(match_id: str, steam_id: str, team: str) -> dict:
+        """"""
+        return {
+            'match_id': match_id,
+            'steam_id_64': str(steam_id),
+            'team': team,
+            'stats': {stat: 0 for stat in STATS},
+        }
+
+    @staticmethod
+    def _public(match: dict) -> dict:
+        """"""
+        return {k: v for k, v in match.items() if k != 'webhooks'}
+
+    async def on_startup(self, app):
+        self.session = ClientSession(timeout=ClientTimeout(total=30))
+
+    async def on_cleanup(self, app):
+        await self.session.close()
+
+    def make_app(self) -> web.Application:
+        """"""
+        app = web.Application(middlewares=[self.inject])
+        app.router.add_get('/api/0.1/game-servers', self.list_servers)
+        app.router.add_get('/api/0.1/game-servers/{server_id}', self.get_server)
+        app.router.add_put('/api/0.1/game-servers/{server_id}', self.update_server)
+        app.router.add_post('/api/0.1/game-servers/{server_id}/start', self.start_server)
+        app.router.add_post('/api/0.1/game-servers/{server_id}/stop', self.stop_server)
+        app.router.add_post('/api/0.1/cs2-matches', self.create_match)
+        app.router.add_get('/api/0.1/cs2-matches/{match_id}', self.get_match)
+        app.router.add_put('/api/0.1/cs2-matches/{match_id}/players', self.add_match_player)
+        app.router.add_post('/api/0.1/cs2-matches/{match_id}/cancel', self.cancel_match)
+        app.router.add_post('/fake/cs2-matches/{match_id}/play', self.play_match)
+        app.router.add_get('/fake/stats', self.stats)
+        app.on_startup.append(self.on_startup)
+        app.on_cleanup.append(self.on_cleanup)
+        return app
+
+
+def record_match(rounds: int=24, players: int=10, seed: int=0, first_steam_id: int=76561198000000000) -> list:
+    """ Play a match offline and return the payload of every round-end webhook followed by the match-end one. """
+    random.seed(seed)
+    fake = FakeDathost(0, 0, 0, 0, 0)
+    match_id = '%024x' % random.getrandbits(96)
+    match = {
+        'id': match_id,
+        'game_server_id': '%024x' % random.getrandbits(96),
+        'team1': {'name': 'team_player0', 'stats': {'score': 0}},
+        'team2': {'name': 'team_player1', 'stats': {'score': 0}},
+        'cancel_reason': None,
+        'finished': False,
+        'rounds_played': 0,
+        'settings': {'map': random.choice(MAPS), 'connect_time': 300},
+        'players': [
+            fake._player(match_id, first_steam_id + i, ('team1', 'team2')[i % 2]) for i in range(players)
+        ],
+    }
+    payloads = []
+    for _ in range(rounds):
+        fake._play_round(match)
+        payloads.append(copy.deepcopy(match))
+    match['finished'] = True
+    payloads.append(copy.deepcopy(match))
+    return payloads
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run a fake Dathost API server.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--servers', type=int, default=10, help="Number of game servers")
+    parser.add_argument('--latency', type=float, default=0.05, help="Mean added latency per API call in seconds")
+    parser.add_argument('--jitter', type=float, default=0.02, help="Standard deviation of the added latency")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="Share of API calls answered with 503")
+    parser.add_argument('--boot-time', type=float, default=2.0, help="Seconds until a started server reports an IP")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    fake = FakeDathost(args.servers, args.latency, args.jitter, args.failure_rate, args.boot_time)
+    web.run_app(fake.make_app(), host=args.host, port=args.port)
@@ -0,0 +1,125 @@
+# tools/fake_discord.py
+
+"""
+Minimal stand-ins for the Discord objects MatchCog and WebServer touch during match setup and finalization.
+
+They let tools/load_test.py run the bot's real match pipeline (start_match, the webhook server, finalize_match)
+in-process without a Discord connection. Every call answers immediately, and the captains pick their server
+location as soon as the dropdown is shown.
+"""
+
+import itertools
+from collections import Counter
+
+
+_ids = itertools.count(1)
+
+
+class FakeRole:
+    """"""
+
+    def __init__(self, role_id: int=None):
+        self.id = role_id or next(_ids)
+
+
+class FakeMessage:
+    """"""
+
+    def __init__(self, channel, location: str=None):
+        self.id = next(_ids)
+        self.channel = channel
+        self.location = location
+        self.embed = None
+
+    async def edit(self, embed=None, view=None, **kwargs):
+        self.channel.calls['message.edit'] += 1
+        self.embed = embed
+        # Answer the server location dropdown for both captains straight away
+        if view is not None and getattr(view, 'users_selections', None):
+            for user in view.users_selections:
+                view.users_selections[user] = self.location
+            view.stop()
+        return self
+
+    async def delete(self):
+        self.channel.calls['message.delete'] += 1
+
+
+class FakeChannel:
+    """ Text, voice or category channel. """
+
+    def __init__(self, guild, name: str='', channel_id: int=None):
+        self.id = channel_id or next(_ids)
+        self.guild = guild
+        self.name = name
+        self.members = []
+        self.calls = guild.calls
+
+    async def send(self, *args, **kwargs):
+        self.calls['channel.send'] += 1
+        return FakeMessage(self)
+
+    async def fetch_message(self, message_id: int):
+        self.calls['channel.fetch_message'] += 1
+        return FakeMessage(self)
+
+    def get_partial_message(self, message_id: int):
+        return FakeMessage(self)
+
+    async def create_voice_channel(self, name: str, **kwargs):
+        return await self.guild.create_voice_channel(name, category=self, **kwargs)
+
+    async def delete(self):
+        self.calls['channel.delete'] += 1
+        self.guild.channels.pop(self.id, None)
+
+
+class FakeMember:
+    """"""
+
+    def __init__(self, user_id: int, name: str):
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.mention = f'<@{user_id}>'
+        self.voice_channel = None
+
+    async def move_to(self, channel):
+        if self.voice_channel is not None and self in self.voice_channel.members:
+            self.voice_channel.members.remove(self)
+        self.voice_channel = channel
+        if channel is not None:
+            channel.members.append(self)
+
+
+class FakeGuild:
+    """ Resolves any channel ID it is asked for, so guild configuration rows always point at a channel. """
+
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+        self.calls = Counter()
+        self.channels = {}
+        self.self_role = FakeRole()
+        self.default_role = FakeRole()
+
+    def get_channel(self, channel_id: int):
+        if channel_id is None:
+            return None
+        if channel_id not in self.channels:
+            self.channels[channel_id] = FakeChannel(self, channel_id=channel_id)
+        return self.channels[channel_id]
+
+    def get_role(self, role_id: int):
+        return FakeRole(role_id) if role_id is not None else None
+
+    async def create_category_channel(self, name: str, **kwargs):
+        self.calls['guild.create_channel'] += 1
+        channel = FakeChannel(self, name)
+        self.channels[channel.id] = channel
+        return channel
+
+    async def create_voice_channel(self, name: str, **kwargs):
+        self.calls['guild.create_channel'] += 1
+        channel = FakeChannel(self, name)
+        self.channels[channel.id] = channel
+        return channel
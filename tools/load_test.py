@@ -0,0 +1,291 @@
+# tools/load_test.py
+
+"""
+Drive N concurrent simulated matches through the bot's match pipeline against tools/fake_dathost.py.
+
+MatchCog and the webhook server run in-process with the stand-in Discord objects of tools/fake_discord.py,
+against the database configured in config.json. Every match is set up by MatchCog.start_match, played out
+by the fake, which posts its round-end and match-end webhooks to the in-process webhook server, and closed
+by MatchCog.finalize_match:
+
+    python tools/fake_dathost.py --servers 20
+    python -m tools.load_test --matches 50 --concurrency 20 --rounds 24
+
+With --warm-pool the matches are run twice, first with every server cold and then with a warm pool of that size
+in --location, and the time to connect (start_match until the server address is posted) is compared:
+
+    python tools/fake_dathost.py --servers 20 --boot-time 20
+    python -m tools.load_test --matches 20 --concurrency 4 --warm-pool 4 --fill-time 25
+
+Use a development database, the guild and users the load test creates are deleted when it finishes.
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from collections import Counter, defaultdict
+from types import SimpleNamespace
+
+from aiohttp import ClientSession, ClientTimeout
+
+from bot.resources import Config
+from bot.helpers.api import APIManager
+from bot.helpers.db import DBManager
+from bot.helpers.servers import GameServerInventory
+from bot.helpers.webhook import WebServer
+from bot.cogs.match import MatchCog
+from tools.fake_discord import FakeChannel, FakeGuild, FakeMember, FakeMessage
+
+
+STAGES = ('setup', 'play', 'finalize', 'total')
+FIRST_USER_ID = 9_000_000_000_000_000_000
+FIRST_STEAM_ID = 9_100_000_000_000_000_000
+
+
+def percentile(values, q):
+    """"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class LoadTestBot:
+    """ The parts of G5Bot that MatchCog and WebServer use, wired to real database, Dathost and inventory helpers. """
+
+    def __init__(self, guild: FakeGuild):
+        self.logger = logging.getLogger('Bot')
+        self.user = SimpleNamespace(avatar=None)
+        self.guild = guild
+        self.users = {}
+        self.cogs = {}
+        self.db = DBManager(self)
+        self.api = APIManager(self)
+        self.servers = GameServerInventory(
+            self.api,
+            self.db,
+            Config.dathost_inventory_refresh_interval,
+            Config.dathost_server_lease_ttl,
+            Config.dathost_ready_poll_min,
+            Config.dathost_ready_poll_max,
+            Config.warm_pool_size,
+            Config.warm_pool_locations,
+            Config.warm_pool_idle_ttl
+        )
+        self.webserver = None
+
+    def get_cog(self, name: str):
+        return self.cogs.get(name)
+
+    def get_guild(self, guild_id: int):
+        return self.guild if guild_id == self.guild.id else None
+
+    def get_user(self, user_id: int):
+        return self.users.get(user_id)
+
+
+async def seed(bot: LoadTestBot, count: int) -> list:
+    """ Create the load test guild, with a results and a waiting channel, and count linked users. """
+    await bot.db.query(
+        "INSERT INTO guilds (id, waiting_channel, results_channel) VALUES ($1, 1, 2)\n"
+        "ON CONFLICT (id) DO UPDATE SET waiting_channel = 1, results_channel = 2;",
+        bot.guild.id
+    )
+    user_ids = [FIRST_USER_ID + i for i in range(count)]
+    await bot.db.query(
+        "INSERT INTO users (id, steam_id) SELECT * FROM unnest($1::BIGINT[], $2::BIGINT[])\n"
+        "ON CONFLICT DO NOTHING;",
+        user_ids, [FIRST_STEAM_ID + i for i in range(count)]
+    )
+    for i, user_id in enumerate(user_ids):
+        bot.users[user_id] = FakeMember(user_id, f'player{i}')
+    return [bot.users[user_id] for user_id in user_ids]
+
+
+async def cleanup(bot: LoadTestBot) -> None:
+    """ Delete everything the load test created, matches go with the guild. """
+    await bot.db.query("DELETE FROM guilds WHERE id = $1;", bot.guild.id)
+    await bot.db.query("DELETE FROM users WHERE id = ANY($1::BIGINT[]);", list(bot.users))
+    await bot.db.query(
+        "DELETE FROM game_server_leases WHERE game_server_id = ANY($1::VARCHAR[]);", list(bot.servers.servers))
+
+
+async def run_match(bot, match_cog, control, users, finalized, args, timings, errors):
+    """ Set up, play and finalize one match through the bot, timing each stage. """
+    guild = bot.guild
+    lobby_channel = FakeChannel(guild, 'lobby')
+    message = FakeMessage(lobby_channel, location=args.location)
+
+    if bot.servers.warm_size:
+        # The lobby crossed the warm pool fill ratio, its last players join while the pool boots
+        bot.servers.schedule_prewarm(args.game_mode)
+        await asyncio.sleep(args.fill_time)
+
+    start = stage_start = time.monotonic()
+
+    def end_stage(stage):
+        nonlocal stage_start
+        now = time.monotonic()
+        timings[stage].append(now - stage_start)
+        stage_start = now
+
+    ok = await match_cog.start_match(
+        guild,
+        message,
+        lobby_channel,
+        users,
+        team_method='random',
+        map_method='random',
+        game_mode=args.game_mode,
+        connect_time=300
+    )
+    if not ok:
+        errors[f"setup: {message.embed.description if message.embed else 'failed'}"] += 1
+        return
+    match_id = match_cog.get_user_match_id(users[0].id, guild.id)
+    end_stage('setup')
+
+    async with control.post(
+        f'{args.fake_url}/fake/cs2-matches/{match_id}/play',
+        params={'rounds': args.rounds, 'interval': args.round_interval}
+    ) as resp:
+        await resp.read()
+    end_stage('play')
+
+    try:
+        await asyncio.wait_for(asyncio.shield(finalized[match_id]), args.finalize_timeout)
+    except asyncio.TimeoutError:
+        errors['finalize: timed out'] += 1
+        return
+    end_stage('finalize')
+    timings['total'].append(time.monotonic() - start)
+
+
+async def main(args):
+    logging.basicConfig(level=logging.WARNING)
+    Config.dathost_base_url = args.fake_url
+    Config.webserver_host = args.webhook_host
+    Config.webserver_port = args.webhook_port
+
+    bot = LoadTestBot(FakeGuild(args.guild_id))
+    await bot.db.connect()
+    bot.api.connect(asyncio.get_running_loop())
+    users = await seed(bot, args.matches * args.players)
+
+    match_cog = MatchCog(bot)
+    bot.cogs['Match'] = match_cog
+    await bot.servers.refresh()
+    if not bot.servers.servers:
+        raise SystemExit("The fake Dathost has no game servers.")
+    bot.servers.start()
+    bot.webserver = WebServer(bot)
+    await bot.webserver.start_webhook_server()
+
+    loop = asyncio.get_running_loop()
+    finalized = defaultdict(loop.create_future)
+    current = {}
+    finalize_match = match_cog.finalize_match
+
+    async def timed_finalize(match_model, match_api, guild_model):
+        """"""
+        start = time.monotonic()
+        try:
+            await finalize_match(match_model, match_api, guild_model)
+        finally:
+            current['timings']['finalize_match'].append(time.monotonic() - start)
+            if not finalized[match_model.id].done():
+                finalized[match_model.id].set_result(None)
+
+    match_cog.finalize_match = timed_finalize
+
+    phases = [('cold servers', 0)]
+    if args.warm_pool:
+        phases.append((f'warm pool of {args.warm_pool}', args.warm_pool))
+    results = []
+    control = ClientSession(timeout=ClientTimeout(total=None))
+    try:
+        for phase, warm_size in phases:
+            bot.servers.warm_size = warm_size
+            bot.servers.warm_locations = [args.location] if warm_size else []
+            timings = current['timings'] = defaultdict(list)
+            errors = Counter()
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def limited(i):
+                async with semaphore:
+                    match_users = users[i * args.players:(i + 1) * args.players]
+                    await run_match(bot, match_cog, control, match_users, finalized, args, timings, errors)
+
+            start = time.monotonic()
+            await asyncio.gather(*[limited(i) for i in range(args.matches)])
+            results.append((phase, time.monotonic() - start, timings, errors))
+
+        async with control.get(f'{args.fake_url}/fake/stats') as resp:
+            fake_stats = await resp.json()
+    finally:
+        await control.close()
+        await bot.webserver.queue.close()
+        await bot.servers.close()
+        await cleanup(bot)
+        await bot.api.close()
+        await bot.db.close()
+
+    for phase, wall, timings, errors in results:
+        completed = len(timings['total'])
+        print(f"Matches ({phase}): {completed}/{args.matches} completed in {wall:.2f}s "
+              f"({completed / wall:.2f} matches/s), errors: {dict(errors) or 'none'}")
+        print(f"{'stage':<22}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+        for stage in STAGES + ('finalize_match',):
+            print(f"{stage:<22}" + ''.join(
+                f"{percentile(timings[stage], q) * 1000:>8.0f}ms" for q in (0.5, 0.95, 0.99, 1)
+            ))
+    if len(results) > 1:
+        print("Time to connect, from a full lobby until the server address is posted:")
+        for phase, wall, timings, errors in results:
+            print(f"{phase:<22}" + ''.join(
+                f"{percentile(timings['setup'], q) * 1000:>8.0f}ms" for q in (0.5, 0.95, 0.99, 1)
+            ))
+
+    for event, values in fake_stats['webhook_latency'].items():
+        print(f"{'webhook.' + event:<22}" + ''.join(
+            f"{percentile(values, q) * 1000:>8.0f}ms" for q in (0.5, 0.95, 0.99, 1)
+        ))
+    # Queue wait plus processing time in the bot, bucketed by its histogram
+    for event, hist in sorted(bot.webserver.queue.latency.items()):
+        print(f"{'queue.' + event:<22}" + ''.join(
+            f"{'<=' + format(hist.quantile(q) * 1000, '.0f'):>8}ms" for q in (0.5, 0.95, 0.99)
+        ) + f"{hist.max * 1000:>8.0f}ms")
+    if match_cog.setup_count:
+        print("Mean setup stages: " + ', '.join(
+            f"{stage}={elapsed / match_cog.setup_count * 1000:.0f}ms" for stage, elapsed in match_cog.setup_timings.items()
+        ))
+    for event, statuses in fake_stats['webhook_statuses'].items():
+        failed = {status: count for status, count in statuses.items() if not status.startswith('2')}
+        print(f"Webhook {event}: {sum(statuses.values())} sent, failures: {failed or 'none'}")
+    print(f"Webhook queue: {dict(bot.webserver.queue.counts)}, duplicates: {bot.webserver.duplicates}")
+    for endpoint, stats in sorted(bot.api.stats.items()):
+        print(f"{endpoint:<24}" + ' '.join(f"{k}={v}" for k, v in sorted(stats.items())))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load test match setup, webhook handling and finalization against a fake Dathost.")
+    parser.add_argument('--fake-url', default='http://127.0.0.1:8080')
+    parser.add_argument('--matches', type=int, default=20, help="Number of simulated matches")
+    parser.add_argument('--concurrency', type=int, default=10, help="Matches in flight at once, keep it at or below the fake's servers")
+    parser.add_argument('--players', type=int, default=10, help="Players per match")
+    parser.add_argument('--rounds', type=int, default=24, help="Rounds played per match")
+    parser.add_argument('--round-interval', type=float, default=0.0, help="Seconds between rounds")
+    parser.add_argument('--location', default='dusseldorf', help="Server location picked by the captains")
+    parser.add_argument('--game-mode', default='competitive')
+    parser.add_argument('--finalize-timeout', type=float, default=60)
+    parser.add_argument('--warm-pool', type=int, default=0, help="Also run the matches with a warm pool of this size")
+    parser.add_argument('--fill-time', type=float, default=5, help="Seconds between pre-warming and the lobby filling up")
+    parser.add_argument('--guild-id', type=int, default=9_000_000_000_000_000_000, help="Guild ID the test data is created under")
+    parser.add_argument('--webhook-host', default='127.0.0.1', help="Address the in-process webhook server listens on")
+    parser.add_argument('--webhook-port', type=int, default=3001)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))